@@ -0,0 +1,234 @@
+"""Offline microbenchmarks for the backend hot paths, with JSON output and a baseline regression check.
+
+Run from backend/:
+    python benchmarks/bench_hotpaths.py                      # print a table
+    python benchmarks/bench_hotpaths.py --save-baseline      # store results/baseline.json
+    python benchmarks/bench_hotpaths.py --check              # compare against it, exit 1 on regression
+    python benchmarks/bench_hotpaths.py --json out.json --only ats,escape
+
+Inputs are synthetic resumes / JDs at three sizes, generated from a fixed seed, so results are
+comparable between runs on the same machine. Nothing touches the network or Gemini.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+# Keep caches and stores out of the working tree; the benchmarks call the uncached functions anyway
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="hireme_bench_cache_"))
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="hireme_bench_data_"))
+
+import main  # noqa: E402
+
+DEFAULT_BASELINE = BENCH_DIR / "results" / "baseline.json"
+SIZES = {
+    # name: (experience entries, bullets per entry, projects, JD words)
+    "small": (3, 3, 2, 150),
+    "medium": (6, 5, 4, 600),
+    "large": (20, 8, 10, 3000),
+}
+
+_WORDS = (
+    "python sql kubernetes docker aws gcp terraform react typescript node graphql postgres redis kafka spark "
+    "airflow pandas numpy pytorch tensorflow scikit-learn fastapi django flask microservices ci/cd jenkins "
+    "github actions observability prometheus grafana latency throughput scalability reliability ownership "
+    "mentoring stakeholders roadmap delivery migration optimisation caching profiling testing security "
+    "led built designed shipped reduced improved automated launched scaled refactored owned drove"
+).split()
+_SPECIALS = ["50%", "C++", "R&D", "$2M", "#1", "A_B", "~10x", "{team}"]
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    parts = [rng.choice(_WORDS) for _ in range(words)]
+    parts[rng.randrange(len(parts))] = rng.choice(_SPECIALS)
+    return " ".join(parts).capitalize() + "."
+
+
+def make_resume_data(size: str, seed: int = 7) -> dict:
+    """Structured resume covering both the /tailor_resume and the Overleaf template schemas."""
+    rng = random.Random(f"{seed}-{size}")
+    n_exp, n_bullets, n_proj, _ = SIZES[size]
+    experience = []
+    for i in range(n_exp):
+        bullets = [_sentence(rng, rng.randint(12, 24)) for _ in range(n_bullets)]
+        experience.append({
+            "title": f"Senior Engineer {i}", "role": f"Senior Engineer {i}", "company": f"Company {i} & Co",
+            "location": "Remote", "date": f"Jan {2010 + i} – Dec {2011 + i}", "start": f"{2010 + i}", "end": f"{2011 + i}",
+            "points": bullets, "bullets": bullets,
+        })
+    projects = []
+    for i in range(n_proj):
+        desc = _sentence(rng, rng.randint(15, 30))
+        projects.append({"title": f"Project {i}", "name": f"Project {i}", "link": f"https://example.com/p{i}",
+                         "url": f"https://example.com/p{i}", "desc": desc, "description": desc,
+                         "bullets": [_sentence(rng, 12)]})
+    skills = [rng.choice(_WORDS) for _ in range(6 + 2 * n_exp)]
+    return {
+        "name": "Jordan Example", "email": "jordan@example.com", "phone": "+1 555 0100",
+        "links": "github.com/jordan", "contact": {"github": "github.com/jordan", "linkedin": "linkedin.com/in/jordan",
+                                                  "website": "jordan.dev", "email": "jordan@example.com", "phone": "+1 555 0100"},
+        "summary": " ".join(_sentence(rng, 20) for _ in range(1 + n_exp // 4)),
+        "skills": skills, "skills_left": skills[::2], "skills_right": skills[1::2],
+        "experience": experience, "projects": projects,
+        "education": [{"date": "2006 – 2010", "degree": "BSc Computer Science", "institute": "State University", "gpa": "3.8"}] * 2,
+        "publications": [{"citation": _sentence(rng, 18)} for _ in range(n_exp // 3)],
+        "certifications": ["AWS Certified Solutions Architect"],
+    }
+
+
+def resume_text_from(data: dict) -> str:
+    lines = [data["name"], data["summary"], ", ".join(data["skills"])]
+    for exp in data["experience"]:
+        lines.append(f"{exp['title']} at {exp['company']} ({exp['date']})")
+        lines.extend(f"- {p}" for p in exp["points"])
+    for pr in data["projects"]:
+        lines.append(f"{pr['title']}: {pr['desc']}")
+    return "\n".join(lines)
+
+
+def make_jd(size: str, seed: int = 11) -> str:
+    rng = random.Random(f"{seed}-{size}")
+    words = SIZES[size][3]
+    sentences = []
+    while words > 0:
+        n = min(words, rng.randint(10, 20))
+        sentences.append(_sentence(rng, n))
+        words -= n
+    return " ".join(sentences)
+
+
+def build_cases(sizes):
+    """(group, name, size, callable) for every benchmark; inputs are built up front."""
+    cases = []
+    resume_tpl = main.get_template("resume.tex")
+    cover_tpl = main.get_template("cover_letter.tex")
+    for size in sizes:
+        data = make_resume_data(size)
+        text = resume_text_from(data)
+        jd = make_jd(size)
+        pdf_bytes = main.render_pdf_download(text)
+        docx_bytes = main.render_docx_download(text)
+        txt_bytes = text.encode("utf-8")
+        model_output = "Here is the tailored resume:\n```json\n" + json.dumps(data, indent=2) + "\n```\nGood luck!"
+        cover = {"name": data["name"], "email": data["email"], "phone": data["phone"], "links": data["links"],
+                 "company": "Acme & Sons", "job_title": "Staff Engineer", "opening": data["summary"],
+                 "skills_fit": " ".join(data["experience"][0]["points"]), "conclusion": data["summary"]}
+        cases += [
+            ("extract", "extract_text_from_file[pdf]", size, lambda b=pdf_bytes: main.extract_text_from_file(b, "resume.pdf")),
+            ("extract", "extract_text_from_file[docx]", size, lambda b=docx_bytes: main.extract_text_from_file(b, "resume.docx")),
+            ("extract", "extract_text_from_file[txt]", size, lambda b=txt_bytes: main.extract_text_from_file(b, "resume.txt")),
+            ("ats", "calculate_ats_score", size, lambda t=text, j=jd: main.calculate_ats_score(t, j)),
+            ("escape", "escape_latex", size, lambda t=text: main.escape_latex(t)),
+            ("render", "render_latex_from_data", size, lambda d=data: main.render_latex_from_data(resume_tpl, d)),
+            ("render", "render_cover_letter_from_data", size, lambda d=cover: main.render_cover_letter_from_data(cover_tpl, d)),
+            ("render", "render_resume_tex_overleaf", size, lambda d=data: main.render_resume_tex_overleaf(d)),
+            ("pdf", "render_simple_pdf_from_data", size, lambda d=data: main.render_simple_pdf_from_data(d)),
+            ("json", "extract_json_object", size, lambda o=model_output: main.extract_json_object(o)),
+            ("prune", "prune_for_single_page", size, lambda d=data: main.prune_for_single_page(d)),
+        ]
+    return cases
+
+
+def measure(fn, repeat: int, min_time: float) -> dict:
+    fn()  # warm up (lazy imports, template compile, pools)
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    # autorange targets ~0.2s; scale to min_time per repeat
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    samples = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "min_us": round(min(samples) * 1e6, 2),
+        "median_us": round(statistics.median(samples) * 1e6, 2),
+        "loops": number,
+        "repeat": repeat,
+    }
+
+
+def run(sizes, only, repeat: int, min_time: float) -> dict:
+    results = {}
+    for group, name, size, fn in build_cases(sizes):
+        if only and group not in only and name not in only:
+            continue
+        key = f"{name}/{size}"
+        results[key] = measure(fn, repeat, min_time)
+        print(f"  {key:<46} median {results[key]['median_us']:>12.1f} us   min {results[key]['min_us']:>12.1f} us", file=sys.stderr)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float, noise_floor_us: float) -> list:
+    """Cases whose median got slower than baseline * (1 + tolerance), ignoring sub-noise-floor changes."""
+    regressions = []
+    for key, cur in current["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if not base:
+            continue
+        delta = cur["median_us"] - base["median_us"]
+        ratio = cur["median_us"] / base["median_us"] if base["median_us"] else float("inf")
+        if ratio > 1 + tolerance and delta > noise_floor_us:
+            regressions.append({"case": key, "baseline_us": base["median_us"], "current_us": cur["median_us"], "ratio": round(ratio, 3)})
+    return regressions
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(SIZES), help="comma-separated subset of: " + ", ".join(SIZES))
+    parser.add_argument("--only", default="", help="comma-separated groups or function names (extract, ats, escape, render, pdf, json, prune)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per repeat")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    parser.add_argument("--save-baseline", nargs="?", const=str(DEFAULT_BASELINE), metavar="PATH")
+    parser.add_argument("--check", nargs="?", const=str(DEFAULT_BASELINE), metavar="PATH", help="compare against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown ratio before failing --check")
+    parser.add_argument("--noise-floor-us", type=float, default=5.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    sizes = [s for s in args.sizes.split(",") if s]
+    unknown = set(sizes) - set(SIZES)
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(sorted(unknown))}")
+    only = {o for o in args.only.split(",") if o}
+    if args.check and not Path(args.check).is_file():
+        print(f"no baseline at {args.check}; run `make bench-baseline` (or --save-baseline) first", file=sys.stderr)
+        return 2
+    report = run(sizes, only, args.repeat, args.min_time)
+
+    if args.json == "-":
+        print(json.dumps(report, indent=2))
+    elif args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        Path(args.save_baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save_baseline).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"baseline written to {args.save_baseline}", file=sys.stderr)
+    if args.check:
+        baseline = json.loads(Path(args.check).read_text(encoding="utf-8"))
+        regressions = compare(report, baseline, args.tolerance, args.noise_floor_us)
+        for r in regressions:
+            print(f"REGRESSION {r['case']}: {r['baseline_us']:.1f} us -> {r['current_us']:.1f} us ({r['ratio']:.2f}x)", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.check}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
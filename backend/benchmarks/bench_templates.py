@@ -0,0 +1,64 @@
+"""Microbenchmark: replace-chain escape_latex and compiled templates vs. the previous implementations.
+
+Run from backend/:  python benchmarks/bench_templates.py
+"""
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+
+_LEGACY_REPLACEMENTS = {
+    "\\": r"\textbackslash{}",
+    "{": r"\{",
+    "}": r"\}",
+    "#": r"\#",
+    "%": r"\%",
+    "&": r"\&",
+    "$": r"\$",
+    "_": r"\_",
+    "^": r"\^{}",
+    "~": r"\~{}",
+}
+
+
+def legacy_escape_latex(text: str) -> str:
+    escaped = ""
+    for ch in text:
+        escaped += _LEGACY_REPLACEMENTS.get(ch, ch)
+    return escaped
+
+
+def legacy_render(template_str: str, values: dict) -> str:
+    tex = template_str
+    for k, v in values.items():
+        tex = tex.replace("{{" + k + "}}", v or "")
+    return tex
+
+
+def bench(label: str, fn, number: int) -> float:
+    best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"  {label:<28} {best * 1e6:>12.1f} us")
+    return best
+
+
+def main_bench():
+    template = (main.TEMPLATE_DIR / "resume_template.tex").read_text(encoding="utf-8")
+    compiled = main.CompiledTemplate(template)
+    for size in (1_000, 10_000, 100_000):
+        text = ("Led C++ & Python work at 50% cost_savings; {shipped} #1 ~feature$ " * (size // 60 + 1))[:size]
+        values = {key: main.escape_latex(text) for key in compiled.keys}
+        number = max(1, 200_000 // size)
+        print(f"input size {size:,} chars")
+        old = bench("escape_latex (legacy)", lambda: legacy_escape_latex(text), number)
+        new = bench("escape_latex (replace chain)", lambda: main.escape_latex(text), number)
+        print(f"  {'speedup':<28} {old / new:>12.1f}x")
+        old = bench("render (str.replace chain)", lambda: legacy_render(template, values), number)
+        new = bench("render (compiled)", lambda: compiled.render(values), number)
+        print(f"  {'speedup':<28} {old / new:>12.1f}x")
+
+
+if __name__ == "__main__":
+    main_bench()
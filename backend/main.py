@@ -1,24 +1,25 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+import time
+_BOOT_STARTED = time.perf_counter()
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-import google.generativeai as genai
+from fastapi.responses import StreamingResponse
+from starlette.requests import HTTPConnection
+import importlib
 import io
-try:
-    import fitz  # PyMuPDF (optional on some hosts)
-except Exception:
-    fitz = None
-import pdfplumber
-from docx import Document
-from docx.shared import Inches
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
 import os
+import sys
 import tempfile
 import re
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import json
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 import asyncio
+from contextvars import ContextVar
 import anyio
 import subprocess
 import shutil
@@ -26,11 +27,73 @@ from fastapi import BackgroundTasks
 
 from pathlib import Path
 import base64
-import requests
-try:
-    import PyPDF2  # optional for page count
-except Exception:
-    PyPDF2 = None
+import secrets
+import sqlite3
+import math
+import heapq
+import bisect
+import random
+import multiprocessing
+import cProfile
+import pstats
+
+# ---------- Lazy imports ----------
+# Parsing, rendering and Gemini libraries are imported on first use so a worker that only
+# serves part of the API never pays for the rest. Set PREWARM_IMPORTS to load them at startup.
+import_timings: Dict[str, Dict] = {}
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access; the import time is
+    recorded in import_timings. Optional modules that fail to import report available == False.
+    """
+    def __init__(self, name: str, optional: bool = False):
+        self._name = name
+        self._optional = optional
+        self._module = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None and not self._failed:
+            with self._lock:
+                if self._module is None and not self._failed:
+                    started = time.perf_counter()
+                    try:
+                        self._module = importlib.import_module(self._name)
+                    except Exception:
+                        if not self._optional:
+                            raise
+                        self._failed = True
+                    import_timings[self._name] = {
+                        "seconds": round(time.perf_counter() - started, 4),
+                        "since_boot": round(started - _BOOT_STARTED, 3),
+                        "available": not self._failed,
+                    }
+        return self._module
+
+    @property
+    def available(self) -> bool:
+        return self.load() is not None
+
+    def __getattr__(self, attr: str):
+        module = self.load()
+        if module is None:
+            raise AttributeError(f"optional module {self._name!r} is not installed")
+        return getattr(module, attr)
+
+genai = LazyModule("google.generativeai")
+glm = LazyModule("google.ai.generativelanguage")
+google_exceptions = LazyModule("google.api_core.exceptions")
+fitz = LazyModule("fitz", optional=True)  # PyMuPDF (optional on some hosts)
+pdfplumber = LazyModule("pdfplumber")
+docx = LazyModule("docx")
+rl_pagesizes = LazyModule("reportlab.lib.pagesizes")
+rl_platypus = LazyModule("reportlab.platypus")
+rl_styles = LazyModule("reportlab.lib.styles")
+requests = LazyModule("requests")
+LAZY_MODULES = (genai, glm, google_exceptions, fitz, pdfplumber, docx, rl_pagesizes, rl_platypus, rl_styles, requests)
+
+_EAGER_IMPORT_SECONDS = round(time.perf_counter() - _BOOT_STARTED, 4)
 
 app = FastAPI(title="HireMe Maker")
 
@@ -43,81 +106,1272 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global variable to store API key for session
-gemini_api_key = None
+# Server-wide fallback key; per-user keys live in the session store (see /set-api-key)
+DEFAULT_GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or None
+# Key of the current request's session, or of the job being run
+_task_api_key: ContextVar[Optional[str]] = ContextVar("task_api_key", default=None)
+
+def current_api_key() -> Optional[str]:
+    return _task_api_key.get() or DEFAULT_GEMINI_API_KEY
+
+# ---------- Caching helpers ----------
+CACHE_DIR = Path(os.getenv("CACHE_DIR") or (Path(__file__).parent / ".cache"))
+DATA_DIR = Path(os.getenv("DATA_DIR") or (Path(__file__).parent / "data"))
+
+class TieredCache:
+    """Bounded in-memory LRU with an optional size-capped on-disk tier.
+    Values are bytes plus a small JSON-serialisable meta dict.
+    """
+    def __init__(self, name: str, max_items: int = 64, disk_dir: Optional[Path] = None, disk_max_bytes: int = 0):
+        self.name = name
+        self.max_items = max(0, max_items)
+        self.disk_dir = Path(disk_dir) if (disk_dir and disk_max_bytes > 0) else None
+        self.disk_max_bytes = disk_max_bytes
+        self._mem: "OrderedDict[str, Tuple[bytes, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Tuple[bytes, Dict]]:
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return entry
+        entry = self._disk_get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._mem_put(key, entry)
+        return entry
+
+    def put(self, key: str, value: bytes, meta: Optional[Dict] = None) -> None:
+        entry = (value, dict(meta or {}))
+        with self._lock:
+            self._mem_put(key, entry)
+        self._disk_put(key, entry)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self._mem),
+                "max_items": self.max_items,
+                "disk_enabled": self.disk_dir is not None,
+            }
+
+    def _mem_put(self, key: str, entry: Tuple[bytes, Dict]) -> None:
+        if self.max_items <= 0:
+            return
+        self._mem[key] = entry
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[Tuple[bytes, Dict]]:
+        if self.disk_dir is None:
+            return None
+        blob = self.disk_dir / f"{key}.bin"
+        try:
+            value = blob.read_bytes()
+            meta_path = self.disk_dir / f"{key}.json"
+            meta = json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists() else {}
+            os.utime(blob)  # refresh recency for eviction
+            return value, meta
+        except Exception:
+            return None
+
+    def _disk_put(self, key: str, entry: Tuple[bytes, Dict]) -> None:
+        if self.disk_dir is None or len(entry[0]) > self.disk_max_bytes:
+            return
+        try:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.disk_dir / f".{key}.{os.getpid()}.tmp"
+            tmp.write_bytes(entry[0])
+            os.replace(tmp, self.disk_dir / f"{key}.bin")
+            (self.disk_dir / f"{key}.json").write_text(json.dumps(entry[1]), encoding="utf-8")
+            self._disk_evict()
+        except Exception:
+            pass
+
+    def _disk_evict(self) -> None:
+        blobs = []
+        total = 0
+        for f in self.disk_dir.glob("*.bin"):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            blobs.append((st.st_mtime, st.st_size, f))
+            total += st.st_size
+        blobs.sort()
+        for _, size, f in blobs:
+            if total <= self.disk_max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            f.with_suffix(".json").unlink(missing_ok=True)
+            total -= size
+
+def content_hash(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+# Bump when templates, macros or compiler flags change in ways not visible in the final TeX source.
+COMPILE_CACHE_VERSION = "1"
+compile_cache = TieredCache(
+    "compile",
+    max_items=int(os.getenv("COMPILE_CACHE_MAX_ITEMS", "64")),
+    disk_dir=CACHE_DIR / "compile",
+    disk_max_bytes=int(os.getenv("COMPILE_CACHE_DISK_MB", "256")) * 1024 * 1024,
+)
+
+def compile_cache_key(tex_source: str, kind: str) -> str:
+    return content_hash(COMPILE_CACHE_VERSION, kind, tex_source)
+
+# ---------- Shared state ----------
+# "memory" keeps sessions, stored documents and jobs in-process (single worker only);
+# "sqlite" puts them in one local database so `uvicorn --workers N` processes share them.
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()
+STATE_DB_PATH = Path(os.getenv("STATE_DB_PATH") or (DATA_DIR / "state.sqlite3"))
+# uvicorn runs WEB_CONCURRENCY worker processes. LaTeX and Gemini limits are meant per deployment,
+# but each process enforces its own, so every worker takes an equal share of them.
+WEB_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY") or 1))
+
+def worker_share(total: int) -> int:
+    """This process's part of a deployment-wide concurrency limit (at least 1)."""
+    return max(1, total // WEB_WORKERS)
+
+class MemoryTtlStore:
+    """Dict values under string keys with a sliding TTL and an LRU size cap."""
+    def __init__(self, ttl_seconds: int, max_items: int):
+        self.ttl = ttl_seconds
+        self.max_items = max(1, max_items)
+        self._items: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key: str, value: Dict) -> None:
+        now = time.time()
+        with self._lock:
+            for k in [k for k, (exp, _) in self._items.items() if exp < now]:
+                del self._items[k]
+            self._items[key] = (now + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] < now:
+                del self._items[key]
+                return None
+            self._items[key] = (now + self.ttl, item[1])
+            self._items.move_to_end(key)
+            return item[1]
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._items.pop(key, None) is not None
+
+class SqliteTtlStore:
+    """MemoryTtlStore semantics backed by a table in a SQLite file shared between processes.
+    Values are stored as JSON (sets become lists).
+    """
+    def __init__(self, path: Path, table: str, ttl_seconds: int, max_items: int):
+        self.path = Path(path)
+        self.table = table
+        self.ttl = ttl_seconds
+        self.max_items = max(1, max_items)
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        if not self._ready:
+            conn.executescript(f"""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS {self.table}_by_expiry ON {self.table} (expires_at);
+            """)
+            self._ready = True
+        return conn
+
+    def put(self, key: str, value: Dict) -> None:
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+                conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                             (key, json.dumps(value, default=list), now + self.ttl))
+                conn.execute(f"""DELETE FROM {self.table} WHERE key IN (
+                                     SELECT key FROM {self.table} ORDER BY expires_at DESC LIMIT -1 OFFSET ?)""", (self.max_items,))
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ? AND expires_at >= ?", (key, now)).fetchone()
+            # Slide the expiry only once half the TTL is used up, so most reads stay read-only
+            if row is not None and row[1] - now < self.ttl / 2:
+                with conn:
+                    conn.execute(f"UPDATE {self.table} SET expires_at = ? WHERE key = ?", (now + self.ttl, key))
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, key: str) -> bool:
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount > 0
+        finally:
+            conn.close()
+
+def make_ttl_store(table: str, ttl_seconds: int, max_items: int):
+    if STATE_BACKEND == "sqlite":
+        return SqliteTtlStore(STATE_DB_PATH, table, ttl_seconds, max_items)
+    if STATE_BACKEND != "memory":
+        raise ValueError(f"Unknown STATE_BACKEND {STATE_BACKEND!r} (use 'memory' or 'sqlite')")
+    return MemoryTtlStore(ttl_seconds, max_items)
+
+# ---------- Metrics ----------
+# Hand-rolled Prometheus instrumentation served on /metrics. An update is one dict lookup under a
+# lock, cheap enough to leave on under load. Each process writes its values to METRICS_DIR every
+# few seconds so whichever worker answers the scrape reports the sum over all of them.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+METRICS_DIR = os.getenv("METRICS_DIR") or (str(DATA_DIR / "metrics") if STATE_BACKEND == "sqlite" else "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+# Snapshots not rewritten for this long belong to exited processes and are dropped (their counters
+# then read as a reset, which rate() handles)
+METRICS_STALE_SECONDS = float(os.getenv("METRICS_STALE_SECONDS") or 3 * METRICS_FLUSH_SECONDS)
+
+class MetricsRegistry:
+    """Counters and histograms of this process plus collectors that turn existing stats() dicts
+    into samples at scrape time. Families are {name: {"type", "help", "samples"}} with samples
+    [suffix, [[label, value], ...], number], which is also the snapshot file format.
+    """
+    def __init__(self, snapshot_dir: Optional[Path] = None):
+        self.snapshot_dir = snapshot_dir
+        self._metrics: List = []
+        # (fn, shared): shared collectors read state every worker sees (SQLite, files) and are not summed
+        self._collectors: List[Tuple[Callable[[], Iterable], bool]] = []
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn: Callable[[], Iterable], shared: bool = False) -> None:
+        """fn returns (name, type, help, [(labels dict, value), ...]) tuples."""
+        self._collectors.append((fn, shared))
+
+    def collect(self, shared: bool = False) -> Dict[str, Dict]:
+        families = {} if shared else {m.name: m.collect() for m in self._metrics}
+        for fn, is_shared in self._collectors:
+            if is_shared != shared:
+                continue
+            try:
+                for name, kind, help_text, samples in fn():
+                    families[name] = {"type": kind, "help": help_text,
+                                      "samples": [["", sorted(labels.items()), value] for labels, value in samples]}
+            except Exception:
+                pass  # a broken collector must not take /metrics down
+        return families
+
+    def gather(self) -> Dict[str, Dict]:
+        """Everything to expose: this process, other workers' snapshots and the shared collectors."""
+        families = self.collect()
+        if self.snapshot_dir:
+            self.write_snapshot(families)
+            now = time.time()
+            for path in self.snapshot_dir.glob("*.json"):
+                if path.stem == str(os.getpid()):
+                    continue
+                try:
+                    if now - path.stat().st_mtime > METRICS_STALE_SECONDS:
+                        path.unlink(missing_ok=True)
+                        continue
+                    other = json.loads(path.read_text(encoding="utf-8"))
+                except (OSError, ValueError):
+                    continue
+                if not _pid_alive(path.stem):
+                    # Final snapshot of a process that just exited: keep its counts, not its in-flight gauges
+                    other = {name: family for name, family in other.items() if family["type"] != "gauge"}
+                families = merge_metric_families(families, other)
+        families.update(self.collect(shared=True))
+        return families
+
+    def write_snapshot(self, families: Optional[Dict] = None) -> None:
+        if not self.snapshot_dir:
+            return
+        try:
+            self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.snapshot_dir / f".{os.getpid()}.tmp"
+            tmp.write_text(json.dumps(families if families is not None else self.collect()), encoding="utf-8")
+            os.replace(tmp, self.snapshot_dir / f"{os.getpid()}.json")
+        except OSError:
+            pass
+
+    def start_flusher(self) -> None:
+        if not self.snapshot_dir or self._flusher is not None:
+            return
+        def loop():
+            while not self._stop.wait(METRICS_FLUSH_SECONDS):
+                self.write_snapshot()
+        self._flusher = threading.Thread(target=loop, name="metrics-flush", daemon=True)
+        self._flusher.start()
+
+    def stop_flusher(self) -> None:
+        self._stop.set()
+        self.write_snapshot()
+
+def _pid_alive(pid: str) -> bool:
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass  # exists, owned by another user
+    return True
+
+def merge_metric_families(into: Dict[str, Dict], other: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Sum other's samples into into (same name, suffix and labels); counts and gauges alike."""
+    for name, family in other.items():
+        target = into.setdefault(name, {"type": family["type"], "help": family["help"], "samples": []})
+        index = {(s[0], tuple(map(tuple, s[1]))): s for s in target["samples"]}
+        for suffix, labels, value in family["samples"]:
+            existing = index.get((suffix, tuple(map(tuple, labels))))
+            if existing is None:
+                sample = [suffix, labels, value]
+                target["samples"].append(sample)
+                index[(suffix, tuple(map(tuple, labels)))] = sample
+            else:
+                existing[2] += value
+    return into
+
+def _prometheus_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def render_prometheus(families: Dict[str, Dict]) -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for suffix, labels, value in family["samples"]:
+            label_str = ",".join(f'{k}="{_prometheus_label_value(v)}"' for k, v in labels)
+            value_str = repr(float(value)) if isinstance(value, float) else str(int(value))
+            lines.append(f"{name}{suffix}{{{label_str}}} {value_str}" if label_str else f"{name}{suffix} {value_str}")
+    return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry(Path(METRICS_DIR) if METRICS_DIR else None)
+
+class CounterMetric:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        metrics.register(self)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> Dict:
+        with self._lock:
+            items = list(self._values.items())
+        return {"type": "counter", "help": self.help,
+                "samples": [["", list(zip(self.labels, key)), value] for key, value in items]}
+
+class HistogramMetric:
+    """Fixed-bucket histogram; observe() is a bisect plus three additions."""
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+        metrics.register(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][slot] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels) -> "HistogramTimer":
+        """Context manager observing the wall time of its block (also when it raises)."""
+        return HistogramTimer(self, labels)
+
+    def collect(self) -> Dict:
+        with self._lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        samples = []
+        for key, buckets, total, count in items:
+            pairs = list(zip(self.labels, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), buckets):
+                cumulative += n
+                samples.append(["_bucket", pairs + [("le", "+Inf" if bound == math.inf else f"{bound:g}")], cumulative])
+            samples.append(["_sum", pairs, total])
+            samples.append(["_count", pairs, count])
+        return {"type": "histogram", "help": self.help, "samples": samples}
+
+class HistogramTimer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: HistogramMetric, labels: Dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+PIPELINE_STAGE_SECONDS = HistogramMetric(
+    "hireme_pipeline_stage_seconds", "Wall time of each generation pipeline stage.", ("pipeline", "stage"))
+PDF_BACKEND_TOTAL = CounterMetric(
+    "hireme_pdf_backend_total", "PDF production attempts by backend (latexmk, pdflatex, compile_cache, latexonline, reportlab, reportlab_fast) "
+    "and outcome (success, failure, rejected by a full compile queue).",
+    ("pipeline", "backend", "outcome"))
+PDF_PAGES_TOTAL = CounterMetric(
+    "hireme_pdf_pages_total", "Page count of delivered PDFs (unknown when the remote compiler was used).", ("pipeline", "pages"))
+PDF_REFITS_TOTAL = CounterMetric(
+    "hireme_pdf_refits_total", "Resumes re-pruned and recompiled because the first compile exceeded one page.", ("pipeline",))
+LLM_REQUEST_SECONDS = HistogramMetric(
+    "hireme_llm_request_seconds", "Gemini calls (cache misses only), including limiter wait and retries.", ("outcome",))
+LATEX_COMPILE_SECONDS = HistogramMetric(
+    "hireme_latex_compile_seconds", "Local TeX runs (all passes) by compiler and whether a preamble format was used.", ("compiler", "preamble_format"))
+LATEX_QUEUE_WAIT_SECONDS = HistogramMetric(
+    "hireme_latex_queue_wait_seconds", "Time TeX processes waited for a compile scheduler slot.")
+HTTP_REQUESTS_TOTAL = CounterMetric(
+    "hireme_http_requests_total", "HTTP requests by route template, method and status.", ("method", "route", "status"))
+HTTP_REQUEST_SECONDS = HistogramMetric(
+    "hireme_http_request_seconds", "HTTP request latency by route template (until the last body chunk).", ("method", "route"))
+
+def pdf_backend_of(compiled: Dict) -> str:
+    """Backend label for a compile_latex result."""
+    return "compile_cache" if compiled.get("cached") else compiled.get("compiler") or "latex"
+
+def pdf_pages_label(page_count: int) -> str:
+    return "unknown" if not page_count else ("1" if page_count == 1 else ("2" if page_count == 2 else "3+"))
+
+# ---------- Sessions ----------
+SESSION_HEADER = "x-session-token"
+SESSION_COOKIE = "hireme_session"
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))
+session_store = make_ttl_store("sessions", SESSION_TTL_SECONDS, int(os.getenv("SESSION_STORE_MAX", "10000")))
+_session_token: ContextVar[Optional[str]] = ContextVar("session_token", default=None)
+
+def session_token_from(conn: HTTPConnection) -> Optional[str]:
+    return conn.headers.get(SESSION_HEADER) or conn.cookies.get(SESSION_COOKIE) or conn.query_params.get("session_token")
+
+class SessionMiddleware:
+    """Resolves the caller's session (X-Session-Token header, cookie or ?session_token= for
+    WebSockets) once per request and exposes its Gemini key through current_api_key().
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        token = session_token_from(HTTPConnection(scope)) if scope["type"] in ("http", "websocket") else None
+        session = await anyio.to_thread.run_sync(session_store.get, token) if token else None
+        if session is None:
+            await self.app(scope, receive, send)
+            return
+        key_token = _task_api_key.set(session.get("api_key"))
+        session_ctx = _session_token.set(token)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _session_token.reset(session_ctx)
+            _task_api_key.reset(key_token)
+
+app.add_middleware(SessionMiddleware)
 
 @app.get("/")
 async def root():
     return {"message": "HireMe Maker API"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the server-side caches."""
+    return {
+        "compile": compile_cache.stats(),
+        "extract": extract_cache.stats(),
+        "download": download_cache.stats(),
+        "latex": compile_timing_stats(),
+        "artifacts": artifact_store.stats(),
+    }
+
 @app.post("/set-api-key")
-async def set_api_key(api_key: str = Form(...)):
-    """Store Gemini API key (minimal validation to avoid false negatives)."""
-    global gemini_api_key
+async def set_api_key(response: Response, api_key: str = Form(...)):
+    """Store the Gemini API key in the caller's session (minimal validation to avoid false negatives).
+    Returns a session_token; send it back as the X-Session-Token header (a cookie is also set).
+    """
     key = api_key.strip()
     if not key:
         raise HTTPException(status_code=400, detail="API key is required")
-    
-    # Simply configure the API key without validation
-    # This allows us to accept any key format and test it only when needed
+    # Reuse the caller's session when it is still alive, otherwise start a new one
+    token = _session_token.get() or secrets.token_urlsafe(32)
+    await anyio.to_thread.run_sync(session_store.put, token, {"api_key": key, "created_at": time.time()})
+    response.set_cookie(SESSION_COOKIE, token, max_age=SESSION_TTL_SECONDS, httponly=True, samesite="lax")
+    return {"status": "success", "message": "API key stored", "session_token": token, "expires_in": SESSION_TTL_SECONDS}
+
+@app.get("/session")
+async def get_session():
+    """Whether the caller has a live session and a Gemini key available."""
+    return {"session": _session_token.get() is not None, "has_api_key": current_api_key() is not None}
+
+@app.delete("/session")
+async def delete_session(response: Response):
+    token = _session_token.get()
+    if token:
+        await anyio.to_thread.run_sync(session_store.delete, token)
+    response.delete_cookie(SESSION_COOKIE)
+    return {"status": "success"}
+
+# ---------- Gemini client ----------
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+# Per API key across all workers; see worker_share
+GEMINI_MAX_CONCURRENT = worker_share(int(os.getenv("GEMINI_MAX_CONCURRENT", "4")))
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "15")) / WEB_WORKERS
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+# API keys whose channel, models and limiter are kept; idle keys beyond this are dropped LRU-first
+GEMINI_MAX_KEYS = int(os.getenv("GEMINI_MAX_KEYS", "256"))
+LLM_CACHE_VERSION = "1"  # bump when prompts change meaning without changing text
+
+class GeminiKeyLimiter:
+    """Per-API-key gate: at most max_concurrent calls in flight, and starts paced to
+    requests_per_minute (with a burst of max_concurrent) so callers queue instead of hitting 429s.
+    """
+    def __init__(self, max_concurrent: int, requests_per_minute: float):
+        self.max_concurrent = max(1, max_concurrent)
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._sem = asyncio.Semaphore(self.max_concurrent)
+        self._tat = 0.0  # theoretical arrival time of the next request (GCRA)
+        self.waiting = 0
+        self.running = 0
+
+    def _reserve(self, deadline: float) -> float:
+        """Reserve a rate-limit slot and return how long to sleep before using it."""
+        if not self.interval:
+            return 0.0
+        now = time.monotonic()
+        tat = max(self._tat, now)
+        start = max(now, tat - self.interval * (self.max_concurrent - 1))
+        if start > deadline:
+            raise HTTPException(
+                status_code=503,
+                detail="Gemini rate limit reached for this API key, please retry shortly.",
+                headers={"Retry-After": str(max(1, int(start - now + 0.5)))},
+            )
+        self._tat = tat + self.interval
+        return start - now
+
+    async def acquire(self, deadline: float):
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Timed out waiting for a Gemini request slot")
+        finally:
+            self.waiting -= 1
+        try:
+            delay = self._reserve(deadline)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._sem.release()
+            raise
+        self.running += 1
+
+    def release(self):
+        self.running -= 1
+        self._sem.release()
+
+class LlmResponseCache:
+    """SQLite-backed cache of Gemini responses keyed by model, generation config and the
+    whitespace-normalised prompt. Entries expire after ttl seconds; least recently used
+    entries are evicted beyond max_items.
+    """
+    def __init__(self, path: Path, ttl: float, max_items: int):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_items = max(0, max_items)
+        self._lock = threading.Lock()
+        self._ready = False
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_name: str, config: Optional[Dict], prompt: str) -> str:
+        normalized = re.sub(r"\s+", " ", prompt or "").strip()
+        return content_hash(LLM_CACHE_VERSION, model_name, json.dumps(config or {}, sort_keys=True), normalized)
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        if not self._ready:
+            conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, text TEXT NOT NULL,
+                                                      created_at REAL NOT NULL, accessed_at REAL NOT NULL) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS responses_by_access ON responses (accessed_at);
+            """)
+            self._ready = True
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.max_items:
+            return None
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    row = conn.execute("SELECT text FROM responses WHERE key = ? AND created_at > ?", (key, now - self.ttl)).fetchone()
+                    if row is not None:
+                        conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            finally:
+                conn.close()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, text: str):
+        if not self.max_items:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO responses (key, text, created_at, accessed_at) VALUES (?, ?, ?, ?)", (key, text, now, now))
+                    conn.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl,))
+                    conn.execute("""DELETE FROM responses WHERE key IN (
+                                        SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)""", (self.max_items,))
+            finally:
+                conn.close()
+
+    def stats(self) -> Dict:
+        entries = 0
+        if self.max_items and self.path.exists():
+            with self._lock:
+                conn = self._connect()
+                try:
+                    entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                finally:
+                    conn.close()
+        return {"entries": entries, "max_items": self.max_items, "ttl_seconds": self.ttl, "hits": self.hits, "misses": self.misses}
+
+llm_cache = LlmResponseCache(
+    Path(os.getenv("LLM_CACHE_PATH") or (CACHE_DIR / "llm_responses.sqlite3")),
+    ttl=float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    max_items=int(os.getenv("LLM_CACHE_MAX_ITEMS", "2000")),
+)
+
+class GeminiClient:
+    """Shared async access to Gemini. Model objects and gRPC channels are created once per
+    API key and reused; every call runs under the key's limiter and an overall deadline.
+    At most max_keys keys are kept; the least recently used idle key is dropped and its channel closed.
+    """
+    def __init__(self, model_name: str, timeout: float, max_concurrent: int, requests_per_minute: float, max_retries: int,
+                 max_keys: int = 256):
+        self.model_name = model_name
+        self.timeout = timeout
+        self.max_concurrent = max_concurrent
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max(0, max_retries)
+        self.max_keys = max(1, max_keys)
+        # api_key -> {"limiter", "models": {temperature: model}, "transport": (loop, client) or None}, in LRU order
+        self._keys: "OrderedDict[str, Dict]" = OrderedDict()
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.total_time = 0.0
+
+    def _key_state(self, api_key: str) -> Dict:
+        state = self._keys.get(api_key)
+        if state is None:
+            state = {"limiter": GeminiKeyLimiter(self.max_concurrent, self.requests_per_minute), "models": {}, "transport": None}
+            self._keys[api_key] = state
+            self._evict(keep=api_key)
+        self._keys.move_to_end(api_key)
+        return state
+
+    def _evict(self, keep: str) -> None:
+        # Oldest first; keys with calls running or queued stay until they go idle
+        for api_key in list(self._keys):
+            if len(self._keys) <= self.max_keys:
+                break
+            limiter = self._keys[api_key]["limiter"]
+            if api_key == keep or limiter.running or limiter.waiting:
+                continue
+            self._close_transport(self._keys.pop(api_key)["transport"])
+
+    @staticmethod
+    def _close_transport(entry: Optional[Tuple[asyncio.AbstractEventLoop, object]]) -> None:
+        if entry is None:
+            return
+        loop, client = entry
+        try:
+            if loop is asyncio.get_running_loop():
+                loop.create_task(client.transport.close())
+        except Exception:
+            pass  # channel of a loop that is gone; nothing left to close
+
+    def _async_transport(self, api_key: str):
+        # gRPC aio channels are bound to the loop they were created on
+        loop = asyncio.get_running_loop()
+        state = self._key_state(api_key)
+        entry = state["transport"]
+        if entry is None or entry[0] is not loop:
+            self._close_transport(entry)
+            entry = (loop, glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key}))
+            state["transport"] = entry
+        return entry[1]
+
+    def model(self, api_key: str, temperature: Optional[float] = None) -> "genai.GenerativeModel":
+        models = self._key_state(api_key)["models"]
+        model = models.get(temperature)
+        if model is None:
+            config = {"temperature": temperature} if temperature is not None else None
+            model = genai.GenerativeModel(self.model_name, generation_config=config)
+            models[temperature] = model
+        model._async_client = self._async_transport(api_key)
+        return model
+
+    def limiter(self, api_key: str) -> GeminiKeyLimiter:
+        return self._key_state(api_key)["limiter"]
+
+    def limiters(self) -> List[GeminiKeyLimiter]:
+        return [state["limiter"] for state in self._keys.values()]
+
+    async def generate(self, prompt: str, api_key: Optional[str] = None, temperature: Optional[float] = None, timeout: Optional[float] = None) -> str:
+        """Generate text for prompt without blocking the event loop; returns the response text.
+        Raises 400 without a key, 503 when rate limited past the deadline and 504 on timeout.
+        """
+        api_key = api_key or current_api_key()
+        if not api_key:
+            raise HTTPException(status_code=400, detail="API key not set")
+        deadline = time.monotonic() + (timeout or self.timeout)
+        limiter = self.limiter(api_key)
+        started = time.perf_counter()
+        self.calls += 1
+        outcome = "ok"
+        try:
+            for attempt in range(self.max_retries + 1):
+                await limiter.acquire(deadline)
+                try:
+                    remaining = deadline - time.monotonic()
+                    resp = await asyncio.wait_for(self.model(api_key, temperature).generate_content_async(prompt), timeout=max(0.0, remaining))
+                    return getattr(resp, "text", "") or ""
+                except asyncio.TimeoutError:
+                    raise HTTPException(status_code=504, detail=f"Gemini request timed out after {timeout or self.timeout:g}s")
+                except google_exceptions.ResourceExhausted:
+                    # Quota tripped anyway (shared key, other clients): back off and retry within the deadline
+                    backoff = 2.0 ** attempt
+                    if attempt == self.max_retries or time.monotonic() + backoff >= deadline:
+                        raise HTTPException(
+                            status_code=503,
+                            detail="Gemini quota exhausted for this API key, please retry shortly.",
+                            headers={"Retry-After": str(int(backoff) + 1)},
+                        )
+                    self.retries += 1
+                finally:
+                    limiter.release()
+                # Sleep without holding the slot so other calls on this key can use it meanwhile
+                await asyncio.sleep(backoff)
+        except Exception as e:
+            self.errors += 1
+            outcome = {503: "quota", 504: "timeout"}.get(getattr(e, "status_code", None), "error")
+            if outcome == "timeout":
+                # Both the call deadline and the wait for a limiter slot
+                self.timeouts += 1
+            raise
+        finally:
+            self.total_time += time.perf_counter() - started
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+
+    async def generate_cached(self, prompt: str, parse: Callable[[str], object] = str, temperature: Optional[float] = None,
+                              bypass_cache: bool = False) -> Tuple[object, bool]:
+        """generate() through llm_cache. Returns (parse(text), served_from_cache).
+        Only responses that parse are stored, so a malformed generation is never replayed;
+        bypass_cache forces a fresh call and refreshes the entry.
+        """
+        config = {"temperature": temperature} if temperature is not None else None
+        key = LlmResponseCache.key(self.model_name, config, prompt)
+        if not bypass_cache:
+            text = await anyio.to_thread.run_sync(llm_cache.get, key)
+            if text is not None:
+                try:
+                    return parse(text), True
+                except Exception:
+                    pass
+        text = await self.generate(prompt, temperature=temperature)
+        parsed = parse(text)
+        await anyio.to_thread.run_sync(llm_cache.put, key, text)
+        return parsed, False
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model_name,
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "avg_seconds": round(self.total_time / self.calls, 3) if self.calls else None,
+            "keys": len(self._keys),
+            "max_keys": self.max_keys,
+            "running": sum(l.running for l in self.limiters()),
+            "waiting": sum(l.waiting for l in self.limiters()),
+            "cache": llm_cache.stats(),
+        }
+
+gemini_client = GeminiClient(
+    GEMINI_MODEL,
+    timeout=GEMINI_TIMEOUT,
+    max_concurrent=GEMINI_MAX_CONCURRENT,
+    requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+    max_retries=GEMINI_MAX_RETRIES,
+    max_keys=GEMINI_MAX_KEYS,
+)
+
+@app.get("/llm/stats")
+async def llm_stats():
+    """Gemini call counters and current per-key queue depth."""
+    return gemini_client.stats()
+
+# ---------- Request profiling ----------
+# Opt-in cProfile capture of single requests: send X-Profile-Token: $PROFILE_ADMIN_TOKEN, or set
+# PROFILE_SAMPLE_RATE to profile a fraction of requests to PROFILE_SAMPLE_PATHS. With neither set
+# the middleware is not installed at all. Profiles are pstats files (snakeviz, `python -m pstats`).
+# /profiles requires the token; without one it is disabled unless PROFILE_ENDPOINTS_UNAUTHENTICATED=1.
+PROFILE_HEADER = "x-profile-token"
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN") or None
+PROFILE_ENDPOINTS_UNAUTHENTICATED = os.getenv("PROFILE_ENDPOINTS_UNAUTHENTICATED", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SAMPLE_PATHS = tuple(p.strip() for p in os.getenv(
+    "PROFILE_SAMPLE_PATHS", "/analyze,/tailor_resume,/generate_cover_letter,/application_bundle").split(",") if p.strip())
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR") or (CACHE_DIR / "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_MAX_MB = float(os.getenv("PROFILE_MAX_MB", "100"))
+_PROFILE_ID = re.compile(r"^[0-9T]+-[0-9a-f]{8}$")
+_active_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("active_profile", default=None)
+# cProfile allows one active profiler per thread, so a process profiles one request at a time
+_profile_slot = threading.Lock()
+
+class _RawStats:
+    """Adapter so pstats.Stats.add() accepts a stats dict captured in another thread or process."""
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+class RequestProfile:
+    """cProfile session for one request. The event-loop profiler also sees other requests' coroutine
+    steps that interleave with this one; work offloaded through run_sync_profiled and pool_submit is
+    profiled in its own thread/process and merged in.
+    """
+    def __init__(self, profile_id: str, trigger: str):
+        self.id = profile_id
+        self.trigger = trigger
+        self.profiler = cProfile.Profile()
+        self.extra: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add_stats(self, stats: Dict) -> None:
+        with self._lock:
+            self.extra.append(stats)
+
+    def call(self, fn, *args):
+        """Run fn(*args) under a profiler of the calling thread and merge its stats."""
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one cProfile per process, and the request's profiler already sees every thread
+            return fn(*args)
+        try:
+            return fn(*args)
+        finally:
+            profiler.disable()
+            profiler.create_stats()
+            self.add_stats(profiler.stats)
+
+    def save(self, meta: Dict) -> None:
+        stats = pstats.Stats(self.profiler)
+        for extra in self.extra:
+            stats.add(_RawStats(extra))
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = PROFILE_DIR / f".{self.id}.tmp"
+        stats.dump_stats(str(tmp))
+        meta = {**meta, "id": self.id, "trigger": self.trigger, "merged_threads": len(self.extra), "bytes": tmp.stat().st_size}
+        (PROFILE_DIR / f"{self.id}.json").write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, PROFILE_DIR / f"{self.id}.prof")
+        prune_profiles()
+
+def prune_profiles() -> None:
+    """Keep at most PROFILE_MAX_FILES profiles and PROFILE_MAX_MB on disk, dropping the oldest."""
+    entries = []
+    for path in PROFILE_DIR.glob("*.prof"):
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    entries.sort(reverse=True)
+    total = 0
+    for kept, (_, size, path) in enumerate(entries):
+        total += size
+        if kept >= PROFILE_MAX_FILES or total > PROFILE_MAX_MB * 1024 * 1024:
+            path.unlink(missing_ok=True)
+            path.with_suffix(".json").unlink(missing_ok=True)
+
+async def run_sync_profiled(fn, *args):
+    """anyio.to_thread.run_sync that is profiled as part of the current request when it is being profiled."""
+    profile = _active_profile.get()
+    if profile is None:
+        return await anyio.to_thread.run_sync(fn, *args)
+    return await anyio.to_thread.run_sync(profile.call, fn, *args)
+
+def _profiled_call(fn, *args) -> Tuple[object, Dict]:
+    profiler = cProfile.Profile()
+    result = profiler.runcall(fn, *args)
+    profiler.create_stats()
+    return result, profiler.stats
+
+class ProfiledFuture:
+    """Future of a pool job run under _profiled_call; result() hands the child's stats to the request profile."""
+    def __init__(self, future, profile: RequestProfile):
+        self._future = future
+        self._profile = profile
+
+    def result(self, timeout: Optional[float] = None):
+        value, stats = self._future.result(timeout=timeout)
+        self._profile.add_stats(stats)
+        return value
+
+    def cancel(self) -> bool:
+        return self._future.cancel()
+
+def pool_submit(pool: ProcessPoolExecutor, fn, *args):
+    """pool.submit(fn, *args), profiled in the child process when the current request is being profiled."""
+    profile = _active_profile.get()
+    if profile is None:
+        return pool.submit(fn, *args)
+    return ProfiledFuture(pool.submit(_profiled_call, fn, *args), profile)
+
+def profile_trigger(scope) -> Optional[str]:
+    """Why to profile this request: "admin" for a valid X-Profile-Token, "sample" when picked by the sampler, else None."""
+    if PROFILE_ADMIN_TOKEN:
+        for name, value in scope.get("headers") or ():
+            if name == b"x-profile-token":
+                return "admin" if secrets.compare_digest(value, PROFILE_ADMIN_TOKEN.encode()) else None
+    if PROFILE_SAMPLE_RATE > 0 and scope["path"].startswith(PROFILE_SAMPLE_PATHS) and random.random() < PROFILE_SAMPLE_RATE:
+        return "sample"
+    return None
+
+class ProfilingMiddleware:
+    """Profiles the requests picked by profile_trigger(); the saved profile's id is returned in X-Profile-Id."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        trigger = profile_trigger(scope) if scope["type"] == "http" else None
+        if trigger is None or not _profile_slot.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile(f"{time.strftime('%Y%m%dT%H%M%S')}-{secrets.token_hex(4)}", trigger)
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        token = _active_profile.set(profile)
+        started_at = time.time()
+        started = time.perf_counter()
+        profile.profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.profiler.disable()
+            _active_profile.reset(token)
+            _profile_slot.release()
+            meta = {"method": scope["method"], "path": scope["path"], "status": status, "started_at": started_at,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 1), "pid": os.getpid()}
+            try:
+                await anyio.to_thread.run_sync(profile.save, meta)
+            except Exception as e:
+                print(f"Profile {profile.id} not saved: {e}")
+
+if PROFILE_ADMIN_TOKEN or PROFILE_SAMPLE_RATE > 0:
+    app.add_middleware(ProfilingMiddleware)
+
+def require_profile_admin(request: Request) -> None:
+    if not PROFILE_ADMIN_TOKEN:
+        if not PROFILE_ENDPOINTS_UNAUTHENTICATED:
+            raise HTTPException(status_code=404, detail="Profile endpoints are disabled; set PROFILE_ADMIN_TOKEN")
+        return
+    if not secrets.compare_digest(request.headers.get(PROFILE_HEADER, ""), PROFILE_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="X-Profile-Token required")
+
+def _profile_path(profile_id: str, suffix: str) -> Path:
+    if not _PROFILE_ID.match(profile_id or ""):
+        raise HTTPException(status_code=404, detail="Unknown profile")
+    path = PROFILE_DIR / f"{profile_id}{suffix}"
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Unknown profile")
+    return path
+
+@app.get("/profiles")
+async def list_profiles(request: Request):
+    """Saved request profiles, newest first."""
+    require_profile_admin(request)
+    def load() -> List[Dict]:
+        out = []
+        for path in PROFILE_DIR.glob("*.json") if PROFILE_DIR.exists() else ():
+            try:
+                out.append(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+        return sorted(out, key=lambda m: m.get("started_at", 0), reverse=True)
+    return {"profiles": await anyio.to_thread.run_sync(load), "sample_rate": PROFILE_SAMPLE_RATE,
+            "admin_token_set": bool(PROFILE_ADMIN_TOKEN), "max_files": PROFILE_MAX_FILES}
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request, format: str = "prof", sort: str = "cumulative", limit: int = 60):
+    """The pstats file (format=prof), or a text report of the top `limit` functions (format=text)."""
+    require_profile_admin(request)
+    path = _profile_path(profile_id, ".prof")
+    if format == "text":
+        if sort not in ("cumulative", "tottime", "ncalls", "pcalls"):
+            raise HTTPException(status_code=400, detail="sort must be one of cumulative, tottime, ncalls, pcalls")
+        def report() -> str:
+            buf = io.StringIO()
+            pstats.Stats(str(path), stream=buf).sort_stats(sort).print_stats(max(1, min(limit, 500)))
+            return buf.getvalue()
+        return Response(await anyio.to_thread.run_sync(report), media_type="text/plain")
+    if format != "prof":
+        raise HTTPException(status_code=400, detail="format must be prof or text")
+    return Response(await anyio.to_thread.run_sync(path.read_bytes), media_type="application/octet-stream",
+                    headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'})
+
+# ---------- Resume text extraction ----------
+EXTRACT_MAX_PAGES = int(os.getenv("EXTRACT_MAX_PAGES", "20"))
+EXTRACT_MAX_CHARS = int(os.getenv("EXTRACT_MAX_CHARS", "200000"))
+EXTRACT_PARALLEL_MIN_PAGES = int(os.getenv("EXTRACT_PARALLEL_MIN_PAGES", "8"))
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS") or min(4, os.cpu_count() or 1))
+PDFPLUMBER_TIMEOUT = float(os.getenv("PDFPLUMBER_TIMEOUT", "10"))
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+def _get_extract_pool() -> ProcessPoolExecutor:
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            # Never fork the threaded server process: workers start from a clean forkserver (spawn elsewhere)
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _extract_pool = ProcessPoolExecutor(max_workers=max(1, EXTRACT_WORKERS), mp_context=multiprocessing.get_context(method))
+        return _extract_pool
+
+def _reset_extract_pool(pool: ProcessPoolExecutor) -> None:
+    """Kill the workers of a pool whose jobs overran their deadline; the next caller gets a fresh pool.
+    Running tasks cannot be cancelled, so this is the only way to stop a pathological PDF.
+    """
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is pool:
+            _extract_pool = None
+    for proc in list((getattr(pool, "_processes", None) or {}).values()):
+        proc.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _pool_results(pool: ProcessPoolExecutor, fn, arg_lists: List[Tuple], deadline: float) -> List:
+    """fn(*args) for each entry of arg_lists on the pool, results in order. The pool is killed and
+    replaced when the deadline passes (422) or a worker dies (BrokenProcessPool is re-raised).
+    """
     try:
-        genai.configure(api_key=key)
-        gemini_api_key = key
-        return {"status": "success", "message": "API key stored"}
-    except HTTPException:
+        futures = [pool_submit(pool, fn, *args) for args in arg_lists]
+        return [fut.result(timeout=max(0.0, deadline - time.monotonic())) for fut in futures]
+    except FuturesTimeoutError:
+        _reset_extract_pool(pool)
+        raise HTTPException(status_code=422, detail=f"PDF text extraction timed out after {PDFPLUMBER_TIMEOUT:g}s")
+    except BrokenProcessPool:
+        _reset_extract_pool(pool)
         raise
-    except Exception as e:
-        # Only catch configuration errors, not validation errors
-        raise HTTPException(status_code=400, detail=f"Failed to configure API: {str(e)}")
 
-def extract_text_from_file(file_content: bytes, filename: str) -> str:
-    """Extract text from uploaded resume file"""
-    if filename.lower().endswith('.pdf'):
-        # Try with PyMuPDF first if available
-        if fitz is not None:
+def _page_chunks(page_count: int) -> List[Tuple[int, int]]:
+    size = max(1, -(-page_count // max(1, EXTRACT_WORKERS)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+def _pymupdf_pages_text(content: bytes, start: int, stop: int) -> List[str]:
+    doc = fitz.open(stream=content, filetype="pdf")
+    try:
+        return [doc[i].get_text() for i in range(start, stop)]
+    finally:
+        doc.close()
+
+def _pdfplumber_page_count(content: bytes) -> int:
+    with pdfplumber.open(io.BytesIO(content)) as pdf:
+        return len(pdf.pages)
+
+def _pdfplumber_pages_text(content: bytes, start: int, stop: int) -> List[str]:
+    with pdfplumber.open(io.BytesIO(content)) as pdf:
+        return [pdf.pages[i].extract_text() or "" for i in range(start, stop)]
+
+def iter_pdf_pages_text(file_content: bytes, max_pages: int = EXTRACT_MAX_PAGES) -> Iterator[str]:
+    """Yield page texts in order, at most `max_pages`. Long documents are fanned out across the
+    extraction process pool; the pdfplumber fallback runs there too. Pool work is bounded by
+    PDFPLUMBER_TIMEOUT and the pool's workers are killed when it is exceeded.
+    """
+    # Try with PyMuPDF first if available; any PyMuPDF error falls back to pdfplumber
+    if fitz.available:
+        try:
+            doc = fitz.open(stream=file_content, filetype="pdf")
             try:
-                doc = fitz.open(stream=file_content, filetype="pdf")
-                text = "".join(page.get_text() for page in doc)
+                page_count = min(doc.page_count, max_pages)
+                inline = page_count < EXTRACT_PARALLEL_MIN_PAGES or EXTRACT_WORKERS <= 1
+                pages = [doc[i].get_text() for i in range(page_count)] if inline else None
+            finally:
                 doc.close()
-                return text
-            except Exception:
-                pass
-        # Fallback to pdfplumber (pure-Python)
-        with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-            text = "".join(page.extract_text() or "" for page in pdf.pages)
-            return text
+            if pages is None:
+                deadline = time.monotonic() + PDFPLUMBER_TIMEOUT
+                chunks = [(file_content, a, b) for a, b in _page_chunks(page_count)]
+                pages = [p for chunk in _pool_results(_get_extract_pool(), _pymupdf_pages_text, chunks, deadline) for p in chunk]
+            yield from pages
+            return
+        except HTTPException:
+            raise
+        except Exception:
+            pass
+    # Fallback to pdfplumber (pure-Python, slow): always off-process with a deadline
+    pool = _get_extract_pool()
+    deadline = time.monotonic() + PDFPLUMBER_TIMEOUT
+    try:
+        page_count = min(_pool_results(pool, _pdfplumber_page_count, [(file_content,)], deadline)[0], max_pages)
+        chunks = _page_chunks(page_count) if page_count >= EXTRACT_PARALLEL_MIN_PAGES else [(0, page_count)]
+        results = _pool_results(pool, _pdfplumber_pages_text, [(file_content, a, b) for a, b in chunks], deadline)
+        pages = [p for chunk in results for p in chunk]
+    except BrokenProcessPool:
+        raise HTTPException(status_code=422, detail="PDF text extraction crashed on this file")
+    yield from pages
+
+def _take_chars(parts: Iterable[str], max_chars: int) -> str:
+    out, total = [], 0
+    for part in parts:
+        if total + len(part) >= max_chars:
+            out.append(part[:max_chars - total])
+            break
+        out.append(part)
+        total += len(part)
+    return "".join(out)
+
+def extract_text_from_file(file_content: bytes, filename: str, max_pages: int = EXTRACT_MAX_PAGES, max_chars: int = EXTRACT_MAX_CHARS) -> str:
+    """Extract text from uploaded resume file, stopping at `max_pages` PDF pages or `max_chars` characters."""
+    if filename.lower().endswith('.pdf'):
+        pages = iter_pdf_pages_text(file_content, max_pages)
+        try:
+            return _take_chars(pages, max_chars)
+        finally:
+            pages.close()
     
     elif filename.lower().endswith(('.doc', '.docx')):
-        doc = Document(io.BytesIO(file_content))
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
+        doc = docx.Document(io.BytesIO(file_content))
+        return _take_chars((paragraph.text + "\n" for paragraph in doc.paragraphs), max_chars)
     
     elif filename.lower().endswith('.txt'):
-        return file_content.decode('utf-8')
+        return file_content.decode('utf-8')[:max_chars]
     
     else:
         raise HTTPException(status_code=400, detail="Unsupported file format")
 
-def calculate_ats_score(resume_text: str, job_description: str) -> Dict:
-    """Calculate ATS score based on keyword matching"""
-    # Extract keywords from job description
-    jd_words = set(re.findall(r'\b[a-zA-Z]{3,}\b', job_description.lower()))
-    resume_words = set(re.findall(r'\b[a-zA-Z]{3,}\b', resume_text.lower()))
-    
-    # Common stop words to exclude (deduplicated)
-    stop_words = {
-        'the','and','for','are','but','not','you','all','can','had','her','was','one','our','out','day','get','has','him','his','how','its',
-        'may','new','old','see','two','who','did','man','way','she','use','your','said','each','which','their','time','will','about','would',
-        'there','could','other','after','first','well','water','been','call','oil','sit','find','long','down','come','made','part'
-    }
-    
-    jd_keywords = jd_words - stop_words
-    resume_keywords = resume_words - stop_words
-    
+extract_cache = TieredCache(
+    "extract",
+    max_items=int(os.getenv("EXTRACT_CACHE_MAX_ITEMS", "256")),
+    disk_dir=CACHE_DIR / "extract",
+    disk_max_bytes=int(os.getenv("EXTRACT_CACHE_DISK_MB", "0")) * 1024 * 1024,
+)
+
+def extract_text_cached(file_content: bytes, filename: str) -> Tuple[str, bool, str]:
+    """extract_text_from_file behind a cache keyed by the SHA-256 of the upload.
+    Returns (text, from_cache, sha256).
+    """
+    digest = hashlib.sha256(file_content).hexdigest()
+    kind = Path(filename or "").suffix.lower()
+    key = content_hash(digest, kind, EXTRACT_MAX_PAGES, EXTRACT_MAX_CHARS)
+    cached = extract_cache.get(key)
+    if cached is not None:
+        return cached[0].decode("utf-8"), True, digest
+    text = extract_text_from_file(file_content, filename)
+    extract_cache.put(key, text.encode("utf-8"))
+    return text, False, digest
+
+# Common stop words to exclude (deduplicated)
+ATS_STOP_WORDS = frozenset({
+    'the','and','for','are','but','not','you','all','can','had','her','was','one','our','out','day','get','has','him','his','how','its',
+    'may','new','old','see','two','who','did','man','way','she','use','your','said','each','which','their','time','will','about','would',
+    'there','could','other','after','first','well','water','been','call','oil','sit','find','long','down','come','made','part'
+})
+_ATS_WORD_RE = re.compile(r'\b[a-zA-Z]{3,}\b')
+
+def ats_tokens(text: str) -> List[str]:
+    """ATS tokens in order, with repeats: 3+ letter words, lower-cased, minus stop words."""
+    return [w for w in _ATS_WORD_RE.findall((text or "").lower()) if w not in ATS_STOP_WORDS]
+
+def ats_keywords(text: str) -> set:
+    """Keyword set used for ATS matching: 3+ letter words, lower-cased, minus stop words."""
+    return set(_ATS_WORD_RE.findall((text or "").lower())) - ATS_STOP_WORDS
+
+def score_keyword_sets(resume_keywords: frozenset, jd_keywords: frozenset) -> Dict:
+    """ATS score of one resume keyword set against one JD keyword set."""
     # Find matching and missing keywords
-    matching_keywords = jd_keywords.intersection(resume_keywords)
+    matching_keywords = jd_keywords & resume_keywords
     missing_keywords = jd_keywords - resume_keywords
     
     # Calculate score
@@ -134,52 +1388,717 @@ def calculate_ats_score(resume_text: str, job_description: str) -> Dict:
         "matched_count": len(matching_keywords)
     }
 
+def calculate_ats_score(resume_text: str, job_description: str, resume_keywords: Optional[set] = None) -> Dict:
+    """Calculate ATS score based on keyword matching.
+    Pass `resume_keywords` (from ats_keywords) to skip re-tokenizing a stored resume.
+    """
+    # Extract keywords from job description
+    jd_keywords = ats_keywords(job_description)
+    if resume_keywords is None:
+        resume_keywords = ats_keywords(resume_text)
+    return score_keyword_sets(frozenset(resume_keywords), jd_keywords)
+
+@lru_cache(maxsize=int(os.getenv("JD_KEYWORD_CACHE_SIZE", "4096")))
+def jd_keyword_set(job_description: str) -> frozenset:
+    """Precompiled (memoised) keyword set for a job description; postings are re-scored often."""
+    return frozenset(ats_keywords(job_description))
+
+def score_resume_against_jds(resume_text: str, job_descriptions: List[str], resume_keywords: Optional[Iterable[str]] = None) -> List[Dict]:
+    """Tokenize the resume once and score it against every JD. Returns results ranked best first;
+    each carries the JD's original `index`.
+    """
+    resume_set = frozenset(resume_keywords) if resume_keywords is not None else frozenset(ats_keywords(resume_text))
+    results = []
+    for index, jd in enumerate(job_descriptions):
+        result = score_keyword_sets(resume_set, jd_keyword_set(jd or ""))
+        result["index"] = index
+        results.append(result)
+    results.sort(key=lambda r: (-r["score"], -r["matched_count"], r["index"]))
+    return results
+
+BATCH_MAX_JDS = int(os.getenv("BATCH_MAX_JDS", "500"))
+
+def parse_top_k(value, default: Optional[int] = None) -> Optional[int]:
+    """Validate a client-supplied top_k: a positive integer, or `default` when missing; 400 otherwise."""
+    if value is None or value == "":
+        return default
+    try:
+        if isinstance(value, (bool, float)):
+            raise ValueError(value)
+        top_k = int(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="top_k must be a positive integer")
+    if top_k < 1:
+        raise HTTPException(status_code=400, detail="top_k must be a positive integer")
+    return top_k
+
+@app.post("/analyze/batch")
+async def analyze_batch(payload: Dict):
+    """Score one resume (resume_text or document_id) against many job descriptions, ranked best first.
+    job_descriptions: list of strings or {"id", "title", "text"} objects; optional top_k.
+    """
+    doc = await get_document(payload.get("document_id"))
+    resume_text = payload.get("resume_text") or (doc["text"] if doc else "")
+    if not isinstance(resume_text, str):
+        raise HTTPException(status_code=400, detail="resume_text must be a string")
+    if not resume_text.strip():
+        raise HTTPException(status_code=400, detail="resume_text or document_id is required")
+    jds = payload.get("job_descriptions") or []
+    if not isinstance(jds, list) or not jds:
+        raise HTTPException(status_code=400, detail="job_descriptions must be a non-empty list")
+    if len(jds) > BATCH_MAX_JDS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_JDS} job descriptions per batch")
+    top_k = parse_top_k(payload.get("top_k"))
+    items = [jd if isinstance(jd, dict) else {"text": str(jd or "")} for jd in jds]
+    texts = [str(it.get("text") or it.get("job_description") or "") for it in items]
+    stored_keywords = doc["keywords"] if doc and not payload.get("resume_text") else None
+    ranked = await anyio.to_thread.run_sync(score_resume_against_jds, resume_text, texts, stored_keywords)
+    if top_k:
+        ranked = ranked[:top_k]
+    for r in ranked:
+        item = items[r["index"]]
+        r["id"] = item.get("id", r["index"])
+        if item.get("title"):
+            r["title"] = item["title"]
+    return {"status": "success", "count": len(items), "results": ranked}
+
+# ---------- Job posting index (BM25) ----------
+class JobPostingIndex:
+    """On-disk (SQLite) inverted index of job descriptions with BM25 ranking.
+    Uses the ATS tokenizer and stop words so rankings agree with calculate_ats_score.
+    """
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, path: Path, max_query_terms: int = 0):
+        self.path = Path(path)
+        # 0 scores every resume term (exact BM25); N keeps only the N most selective (highest-IDF) terms
+        self.max_query_terms = max_query_terms
+        self._write_lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        if not self._ready:
+            conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS postings (id TEXT PRIMARY KEY, title TEXT, text TEXT, length INTEGER NOT NULL, added_at REAL);
+                CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS term_postings (term TEXT NOT NULL, posting_id TEXT NOT NULL, tf INTEGER NOT NULL,
+                                                          PRIMARY KEY (term, posting_id)) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS term_postings_by_posting ON term_postings (posting_id);
+            """)
+            self._ready = True
+        return conn
+
+    def _delete(self, conn: sqlite3.Connection, posting_id: str) -> bool:
+        rows = conn.execute("SELECT term FROM term_postings WHERE posting_id = ?", (posting_id,)).fetchall()
+        conn.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", rows)
+        conn.execute("DELETE FROM terms WHERE df <= 0")
+        conn.execute("DELETE FROM term_postings WHERE posting_id = ?", (posting_id,))
+        return conn.execute("DELETE FROM postings WHERE id = ?", (posting_id,)).rowcount > 0
+
+    def add(self, postings: List[Dict]) -> List[str]:
+        """Insert or replace postings ({"id"?, "title"?, "text"}); returns their IDs."""
+        ids = []
+        with self._write_lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    for posting in postings:
+                        posting_id = str(posting.get("id") or secrets.token_hex(8))
+                        tokens = ats_tokens(posting.get("text") or "")
+                        tf: Dict[str, int] = {}
+                        for tok in tokens:
+                            tf[tok] = tf.get(tok, 0) + 1
+                        self._delete(conn, posting_id)
+                        conn.execute("INSERT INTO postings (id, title, text, length, added_at) VALUES (?, ?, ?, ?, ?)",
+                                     (posting_id, posting.get("title") or "", posting.get("text") or "", len(tokens), time.time()))
+                        conn.executemany("INSERT INTO term_postings (term, posting_id, tf) VALUES (?, ?, ?)",
+                                         [(t, posting_id, n) for t, n in tf.items()])
+                        conn.executemany("INSERT INTO terms (term, df) VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                                         [(t,) for t in tf])
+                        ids.append(posting_id)
+            finally:
+                conn.close()
+        return ids
+
+    def delete(self, posting_id: str) -> bool:
+        with self._write_lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    return self._delete(conn, posting_id)
+            finally:
+                conn.close()
+
+    def stats(self) -> Dict:
+        conn = self._connect()
+        try:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM postings").fetchone()
+            terms = conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+        finally:
+            conn.close()
+        return {"postings": count, "terms": terms, "avg_length": round(total / count, 1) if count else 0.0,
+                "max_query_terms": self.max_query_terms}
+
+    def top_k(self, resume_text: str, k: int = 10,
+              resume_keywords: Optional[Iterable[str]] = None) -> Tuple[List[Dict], Dict]:
+        """BM25 top-k postings for a resume, using its keyword set as the query.
+        Returns (results, query info: terms in the index, terms scored, whether max_query_terms cut the query).
+        """
+        query = list(resume_keywords if resume_keywords is not None else ats_keywords(resume_text))
+        info = {"query_terms": 0, "query_terms_used": 0, "query_truncated": False}
+        if not query:
+            return [], info
+        conn = self._connect()
+        try:
+            n_docs, total_len = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM postings").fetchone()
+            if not n_docs:
+                return [], info
+            avg_len = total_len / n_docs
+            idf = {}
+            for start in range(0, len(query), 500):
+                chunk = query[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                for term, df in conn.execute(f"SELECT term, df FROM terms WHERE term IN ({marks})", chunk):
+                    idf[term] = math.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+            selected = list(idf)
+            if self.max_query_terms and len(selected) > self.max_query_terms:
+                # Rare terms dominate BM25, so the cap drops the most common ones first
+                selected = sorted(selected, key=idf.get, reverse=True)[:self.max_query_terms]
+            info = {"query_terms": len(idf), "query_terms_used": len(selected), "query_truncated": len(selected) < len(idf)}
+            if not selected:
+                return [], info
+            scores: Dict[str, float] = {}
+            k1, b = self.K1, self.B
+            for start in range(0, len(selected), 500):
+                chunk = selected[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                sql = (f"SELECT tp.term, tp.posting_id, tp.tf, p.length FROM term_postings tp "
+                       f"JOIN postings p ON p.id = tp.posting_id WHERE tp.term IN ({marks})")
+                for term, posting_id, tf, length in conn.execute(sql, chunk):
+                    norm = k1 * (1 - b + b * length / avg_len) if avg_len else k1
+                    scores[posting_id] = scores.get(posting_id, 0.0) + idf[term] * tf * (k1 + 1) / (tf + norm)
+            best = heapq.nlargest(max(1, k), scores.items(), key=lambda kv: kv[1])
+            titles = {}
+            if best:
+                marks = ",".join("?" * len(best))
+                titles = dict(conn.execute(f"SELECT id, title FROM postings WHERE id IN ({marks})", [pid for pid, _ in best]))
+        finally:
+            conn.close()
+        return [{"id": pid, "title": titles.get(pid, ""), "score": round(score, 4)} for pid, score in best], info
+
+job_index = JobPostingIndex(
+    Path(os.getenv("JOB_INDEX_PATH") or (DATA_DIR / "job_postings.sqlite3")),
+    max_query_terms=int(os.getenv("JOB_INDEX_MAX_QUERY_TERMS", "0")),
+)
+
+@app.post("/postings")
+async def add_postings(payload: Dict):
+    """Add or replace job postings in the BM25 index: {"id"?, "title"?, "text"} or {"postings": [...]}."""
+    postings = payload.get("postings") if isinstance(payload.get("postings"), list) else [payload]
+    postings = [p for p in postings if isinstance(p, dict) and (p.get("text") or "").strip()]
+    if not postings:
+        raise HTTPException(status_code=400, detail="At least one posting with non-empty text is required")
+    ids = await anyio.to_thread.run_sync(job_index.add, postings)
+    return {"status": "success", "ids": ids}
+
+@app.delete("/postings/{posting_id}")
+async def delete_posting(posting_id: str):
+    if not await anyio.to_thread.run_sync(job_index.delete, posting_id):
+        raise HTTPException(status_code=404, detail="Posting not found")
+    return {"status": "success", "id": posting_id}
+
+@app.get("/postings/stats")
+async def postings_stats():
+    return await anyio.to_thread.run_sync(job_index.stats)
+
+@app.post("/postings/match")
+async def match_postings(payload: Dict):
+    """Top-k stored postings for a resume (resume_text or document_id), ranked by BM25.
+    query_truncated is true when JOB_INDEX_MAX_QUERY_TERMS limited the query to its rarest terms.
+    """
+    doc = await get_document(payload.get("document_id"))
+    resume_text = payload.get("resume_text") or (doc["text"] if doc else "")
+    if not isinstance(resume_text, str):
+        raise HTTPException(status_code=400, detail="resume_text must be a string")
+    if not resume_text.strip():
+        raise HTTPException(status_code=400, detail="resume_text or document_id is required")
+    top_k = parse_top_k(payload.get("top_k"), default=10)
+    stored_keywords = doc["keywords"] if doc and not payload.get("resume_text") else None
+    results, query = await anyio.to_thread.run_sync(job_index.top_k, resume_text, top_k, stored_keywords)
+    return {"status": "success", "results": results, **query}
+
+# ---------- Server-side resume documents ----------
+class DocumentStore:
+    """Extracted resume text plus derived data (keyword set, hash) kept under an opaque ID with a sliding TTL,
+    so multi-step flows can send `document_id` instead of the full resume_text.
+    Backed by make_ttl_store, so with STATE_BACKEND=sqlite every worker process sees every document.
+    """
+    def __init__(self, ttl_seconds: int, max_documents: int):
+        self.ttl = ttl_seconds
+        self._store = make_ttl_store("documents", ttl_seconds, max_documents)
+
+    def put(self, text: str, sha256: Optional[str] = None, keywords: Optional[frozenset] = None) -> str:
+        doc_id = secrets.token_urlsafe(16)
+        self._store.put(doc_id, {
+            "text": text,
+            "keywords": keywords if keywords is not None else frozenset(ats_keywords(text)),
+            "sha256": sha256 or hashlib.sha256(text.encode("utf-8")).hexdigest(),
+        })
+        return doc_id
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        doc = self._store.get(doc_id)
+        if doc is None:
+            return None
+        # The SQLite backend round-trips the keyword set through JSON as a list
+        return {**doc, "keywords": frozenset(doc["keywords"])}
+
+document_store = DocumentStore(
+    ttl_seconds=int(os.getenv("DOCUMENT_TTL_SECONDS", "3600")),
+    max_documents=int(os.getenv("DOCUMENT_STORE_MAX", "1000")),
+)
+
+async def get_document(document_id: Optional[str]) -> Optional[Dict]:
+    """Look up a stored resume document; 404 if the ID is unknown or expired, None if no ID was given."""
+    if not document_id:
+        return None
+    doc = await anyio.to_thread.run_sync(document_store.get, document_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Resume document not found or expired; re-upload the resume")
+    return doc
+
+async def resolve_resume_text(payload: Dict, field: str = "resume_text") -> str:
+    """Return payload[field], or the stored text when the payload references a `document_id`."""
+    doc = await get_document(payload.get("document_id"))
+    if doc is not None and not payload.get(field):
+        return doc["text"]
+    return payload.get(field, "") or ""
+
+# ---------- Artifact store ----------
+ARTIFACT_DIR = Path(os.getenv("ARTIFACT_DIR") or (CACHE_DIR / "artifacts"))
+_ARTIFACT_ID_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+class ArtifactStore:
+    """Generated files (PDF, TeX) kept on disk under opaque IDs with a TTL and a total size cap,
+    served as binary by /artifacts/{id}. Metadata sits next to each blob so all workers see it.
+    """
+    def __init__(self, root: Path, ttl_seconds: int, max_bytes: int):
+        self.root = Path(root)
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def _paths(self, artifact_id: str) -> Tuple[Path, Path]:
+        return self.root / f"{artifact_id}.bin", self.root / f"{artifact_id}.json"
+
+    def put(self, content: bytes, content_type: str, filename: str) -> Dict:
+        """Store content and return its public reference: id, url, size, etag, content_type, filename, expires_at."""
+        artifact_id = secrets.token_urlsafe(16)
+        now = time.time()
+        meta = {
+            "id": artifact_id,
+            "url": f"/artifacts/{artifact_id}",
+            "size": len(content),
+            "etag": hashlib.sha256(content).hexdigest()[:32],
+            "content_type": content_type,
+            "filename": filename,
+            "expires_at": int(now + self.ttl),
+        }
+        bin_path, meta_path = self._paths(artifact_id)
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Stage both files and publish the blob before the metadata, so a reader that finds the
+        # .json always finds a complete .bin next to it
+        bin_tmp = self.root / f".{artifact_id}.bin.{os.getpid()}.tmp"
+        meta_tmp = self.root / f".{artifact_id}.json.{os.getpid()}.tmp"
+        try:
+            bin_tmp.write_bytes(content)
+            meta_tmp.write_text(json.dumps(meta), encoding="utf-8")
+            os.replace(bin_tmp, bin_path)
+            os.replace(meta_tmp, meta_path)
+        finally:
+            bin_tmp.unlink(missing_ok=True)
+            meta_tmp.unlink(missing_ok=True)
+        with self._lock:
+            if now - self._last_purge >= 30:
+                self._purge(now)
+                self._last_purge = now
+        return meta
+
+    def put_text(self, text: str, content_type: str, filename: str) -> Dict:
+        return self.put(text.encode("utf-8"), f"{content_type}; charset=utf-8", filename)
+
+    def get(self, artifact_id: str) -> Optional[Tuple[Path, Dict]]:
+        if not _ARTIFACT_ID_RE.match(artifact_id or ""):
+            return None
+        bin_path, meta_path = self._paths(artifact_id)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if meta.get("expires_at", 0) < time.time() or not bin_path.exists():
+            return None
+        return bin_path, meta
+
+    def _purge(self, now: float) -> None:
+        """Drop expired artifacts and stale staging files, then the oldest artifacts while over max_bytes."""
+        for tmp in self.root.glob(".*.tmp"):
+            try:
+                if tmp.stat().st_mtime < now - self.ttl:
+                    tmp.unlink(missing_ok=True)
+            except OSError:
+                pass
+        entries = []
+        for meta_path in self.root.glob("*.json"):
+            bin_path = meta_path.with_suffix(".bin")
+            try:
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                size = bin_path.stat().st_size
+            except (OSError, ValueError):
+                meta, size = {}, 0
+            if meta.get("expires_at", 0) < now:
+                meta_path.unlink(missing_ok=True)
+                bin_path.unlink(missing_ok=True)
+            else:
+                entries.append((meta["expires_at"], size, meta_path, bin_path))
+        total = sum(e[1] for e in entries)
+        for _, size, meta_path, bin_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            meta_path.unlink(missing_ok=True)
+            bin_path.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self) -> Dict:
+        files = list(self.root.glob("*.bin")) if self.root.exists() else []
+        return {"artifacts": len(files), "bytes": sum(f.stat().st_size for f in files), "max_bytes": self.max_bytes, "ttl_seconds": self.ttl}
+
+artifact_store = ArtifactStore(
+    ARTIFACT_DIR,
+    ttl_seconds=int(os.getenv("ARTIFACT_TTL_SECONDS", "3600")),
+    max_bytes=int(float(os.getenv("ARTIFACT_STORE_MAX_MB", "512")) * 1024 * 1024),
+)
+
+def generated_artifacts(pdf: bytes, filename: str, tex: Optional[str] = None) -> Dict:
+    """Store a generated PDF (and its LaTeX source) and return the response fields referencing them."""
+    fields = {"pdf_artifact": artifact_store.put(pdf, "application/pdf", filename)}
+    if tex is not None:
+        fields["tex_artifact"] = artifact_store.put_text(tex, "application/x-tex", re.sub(r"\.pdf$", "", filename) + ".tex")
+    return fields
+
+def _iter_file_range(path: Path, start: int, length: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=start-end" range into inclusive offsets. Returns None for headers we
+    ignore (multiple ranges, other units, malformed) and raises 416 when the range is unsatisfiable.
+    """
+    m = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header or "")
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if m.group(1):
+        start = int(m.group(1))
+        end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+    else:
+        start, end = max(0, size - int(m.group(2))), size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+@app.api_route("/artifacts/{artifact_id}", methods=["GET", "HEAD"])
+async def get_artifact(artifact_id: str, request: Request):
+    """Stream a stored artifact. Supports ETag / If-None-Match and single-range Range / If-Range requests."""
+    found = artifact_store.get(artifact_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired artifact_id")
+    path, meta = found
+    size = meta["size"]
+    etag = f'"{meta["etag"]}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": f"private, max-age={max(0, int(meta['expires_at'] - time.time()))}",
+        "Content-Disposition": f'inline; filename="{meta["filename"]}"',
+    }
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if request.headers.get("range") and (not if_range or if_range == etag):
+        byte_range = _parse_byte_range(request.headers["range"], size)
+    if byte_range is None:
+        start, length, status = 0, size, 200
+    else:
+        start, length, status = byte_range[0], byte_range[1] - byte_range[0] + 1, 206
+        headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{size}"
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(_iter_file_range(path, start, length), status_code=status, media_type=meta["content_type"], headers=headers)
+
 @app.post("/analyze")
 async def analyze_resume(
     resume: UploadFile = File(...),
-    job_description: str = Form(...)
+    job_description: str = Form(...),
+    include_text: bool = Form(True)
 ):
     """Analyze resume against job description and return ATS score"""
     try:
         # Extract text from resume
         resume_content = await resume.read()
-        resume_text = extract_text_from_file(resume_content, resume.filename)
+        resume_text, text_cached, resume_sha256 = await run_sync_profiled(extract_text_cached, resume_content, resume.filename)
+        
+        resume_keywords = frozenset(ats_keywords(resume_text))
+        document_id = await anyio.to_thread.run_sync(document_store.put, resume_text, resume_sha256, resume_keywords)
         
         # Calculate ATS score
-        ats_analysis = calculate_ats_score(resume_text, job_description)
+        ats_analysis = calculate_ats_score(resume_text, job_description, resume_keywords)
         
         return {
             "status": "success",
-            "resume_text": resume_text,
+            "document_id": document_id,
+            "document_ttl_seconds": document_store.ttl,
+            "resume_text": resume_text if include_text else None,
             "ats_score": ats_analysis["score"],
             "matching_keywords": ats_analysis["matching_keywords"],
             "missing_keywords": ats_analysis["missing_keywords"],
-            "analysis": ats_analysis
+            "analysis": ats_analysis,
+            "text_cached": text_cached,
+            "resume_sha256": resume_sha256,
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
-def escape_latex(text: str) -> str:
-    if text is None:
-        return ""
-    # Escape LaTeX special characters
-    replacements = {
-        "\\": r"\textbackslash{}",
-        "{": r"\{",
-        "}": r"\}",
-        "#": r"\#",
-        "%": r"\%",
-        "&": r"\&",
-        "$": r"\$",
-        "_": r"\_",
-        "^": r"\^{}",
-        "~": r"\~{}",
-    }
-    escaped = ""
-    for ch in text:
-        escaped += replacements.get(ch, ch)
-    return escaped
+# ---------- Live ATS scoring (WebSocket) ----------
+# Per-target text cap; defaults to the extraction cap so any stored resume document fits
+LIVE_ATS_MAX_CHARS = int(os.getenv("LIVE_ATS_MAX_CHARS") or EXTRACT_MAX_CHARS)
+
+def _is_word_char(ch: str) -> bool:
+    # Mirrors \w so edits are re-tokenized on the same boundaries as _ATS_WORD_RE
+    return ch.isalnum() or ch == "_"
+
+class LiveAtsSession:
+    """Per-connection resume/JD keyword multisets. Text edits re-tokenize only the touched words and
+    update the matching/missing sets for the terms that changed.
+    """
+    def __init__(self, max_chars: int = LIVE_ATS_MAX_CHARS):
+        self.max_chars = max_chars
+        self.texts = {"resume": "", "jd": ""}
+        self.counts = {"resume": Counter(), "jd": Counter()}
+        self.matching = set()
+        self.missing = set()
+        self.version = 0
+
+    def _check_size(self, target: str, length: int) -> None:
+        if length > self.max_chars:
+            raise ValueError(f"{target} text is limited to {self.max_chars} characters")
+
+    def set_text(self, target: str, text: str) -> None:
+        self._check_size(target, len(text or ""))
+        old_terms = set(self.counts[target])
+        self.texts[target] = text or ""
+        self.counts[target] = Counter(ats_tokens(self.texts[target]))
+        self._refresh(old_terms | set(self.counts[target]))
+
+    def apply_edit(self, target: str, start: int, end: int, text: str) -> None:
+        """Replace texts[target][start:end] with `text`."""
+        old = self.texts[target]
+        start = max(0, min(int(start), len(old)))
+        end = max(start, min(int(end), len(old)))
+        text = text or ""
+        self._check_size(target, len(old) - (end - start) + len(text))
+        # Widen to whole words so partially edited tokens are removed and re-added
+        a, b = start, end
+        while a > 0 and _is_word_char(old[a - 1]):
+            a -= 1
+        while b < len(old) and _is_word_char(old[b]):
+            b += 1
+        new = old[:start] + text + old[end:]
+        removed = Counter(ats_tokens(old[a:b]))
+        added = Counter(ats_tokens(new[a:b + len(text) - (end - start)]))
+        counts = self.counts[target]
+        counts.subtract(removed)
+        counts.update(added)
+        for term in removed:
+            if counts[term] <= 0:
+                del counts[term]
+        self.texts[target] = new
+        self._refresh(set(removed) | set(added))
+
+    def _refresh(self, terms: Iterable[str]) -> None:
+        resume, jd = self.counts["resume"], self.counts["jd"]
+        for term in terms:
+            self.matching.discard(term)
+            self.missing.discard(term)
+            if jd.get(term, 0) > 0:
+                (self.matching if resume.get(term, 0) > 0 else self.missing).add(term)
+        self.version += 1
+
+    def snapshot(self) -> Dict:
+        total = len(self.counts["jd"])
+        return {
+            "type": "score",
+            "version": self.version,
+            "score": round(len(self.matching) / total * 100, 2) if total else 0,
+            "matching_keywords": list(self.matching)[:20],
+            "missing_keywords": list(self.missing)[:20],
+            "total_jd_keywords": total,
+            "matched_count": len(self.matching),
+        }
+
+@app.websocket("/ws/ats")
+async def live_ats(websocket: WebSocket):
+    """Live ATS scoring. Client messages (JSON):
+    {"type": "set", "target": "resume"|"jd", "text": "..."},
+    {"type": "edit", "target": ..., "start": i, "end": j, "text": "..."} (or "edits": [...] for several),
+    {"type": "load_document", "document_id": "..."}.
+    Every message is answered with the current score snapshot (or {"type": "error"}), including
+    malformed frames and edits that would grow a text past LIVE_ATS_MAX_CHARS.
+    """
+    await websocket.accept()
+    session = LiveAtsSession()
+    max_message_chars = 2 * session.max_chars + 4096
+    document_id = websocket.query_params.get("document_id")
+    try:
+        if document_id:
+            doc = await anyio.to_thread.run_sync(document_store.get, document_id)
+            try:
+                if doc is None:
+                    raise ValueError("Resume document not found or expired")
+                session.set_text("resume", doc["text"])
+                await websocket.send_json(session.snapshot())
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            try:
+                raw = message.get("text")
+                if raw is None:
+                    raise ValueError("messages must be JSON text frames")
+                # Room for rewriting both texts in one message plus the JSON around them
+                if len(raw) > max_message_chars:
+                    raise ValueError(f"message is limited to {max_message_chars} characters")
+                msg = json.loads(raw)
+                if not isinstance(msg, dict):
+                    raise ValueError("message must be a JSON object")
+                kind = msg.get("type")
+                if kind == "load_document":
+                    doc = await anyio.to_thread.run_sync(document_store.get, msg.get("document_id") or "")
+                    if doc is None:
+                        raise ValueError("Resume document not found or expired")
+                    session.set_text("resume", doc["text"])
+                else:
+                    target = msg.get("target")
+                    if target not in ("resume", "jd"):
+                        raise ValueError("target must be 'resume' or 'jd'")
+                    if kind == "set":
+                        session.set_text(target, str(msg.get("text") or ""))
+                    elif kind == "edit":
+                        for edit in msg.get("edits") or [msg]:
+                            session.apply_edit(target, edit.get("start", 0), edit.get("end", 0), str(edit.get("text") or ""))
+                    else:
+                        raise ValueError("type must be 'set', 'edit' or 'load_document'")
+                await websocket.send_json(session.snapshot())
+            except (ValueError, TypeError, AttributeError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+
+# ---------- LaTeX templating ----------
+# Backslash is handled by splitting on it, so the braces of \textbackslash{} are never escaped again
+_LATEX_ESCAPES = (
+    ("{", r"\{"),
+    ("}", r"\}"),
+    ("#", r"\#"),
+    ("%", r"\%"),
+    ("&", r"\&"),
+    ("$", r"\$"),
+    ("_", r"\_"),
+    ("^", r"\^{}"),
+    ("~", r"\~{}"),
+)
+
+def _escape_latex_chunk(text: str) -> str:
+    # One C-level str.replace per special character actually present; plain text is only scanned
+    for ch, replacement in _LATEX_ESCAPES:
+        if ch in text:
+            text = text.replace(ch, replacement)
+    return text
+
+def escape_latex(text: str) -> str:
+    if text is None:
+        return ""
+    text = str(text)
+    if "\\" in text:
+        return r"\textbackslash{}".join(_escape_latex_chunk(part) for part in text.split("\\"))
+    return _escape_latex_chunk(text)
+
+_PLACEHOLDER_RE = re.compile(r"\{\{([A-Z_]+)\}\}")
+
+class CompiledTemplate:
+    """Template pre-split into literal text and {{PLACEHOLDER}} slots so rendering is one join.
+    Placeholders missing from the values are left in place, like the old str.replace chain.
+    """
+    def __init__(self, source: str):
+        self.source = source
+        self.literals: List[str] = []
+        self.keys: List[str] = []
+        pos = 0
+        for m in _PLACEHOLDER_RE.finditer(source):
+            self.literals.append(source[pos:m.start()])
+            self.keys.append(m.group(1))
+            pos = m.end()
+        self.literals.append(source[pos:])
+
+    def render(self, values: Dict[str, str]) -> str:
+        parts = [self.literals[0]]
+        for key, literal in zip(self.keys, self.literals[1:]):
+            parts.append((values[key] or "") if key in values else "{{" + key + "}}")
+            parts.append(literal)
+        return "".join(parts)
+
+@lru_cache(maxsize=32)
+def compile_template(template_str: str) -> CompiledTemplate:
+    return CompiledTemplate(template_str)
+
+TEMPLATE_DIR = Path(__file__).parent / "templates"
+_template_registry: Dict[str, Tuple[float, CompiledTemplate]] = {}
+_template_registry_lock = threading.Lock()
+
+def get_template(name: str) -> Optional[CompiledTemplate]:
+    """Compiled templates/<name>, re-parsed only when the file's mtime changes; None if it doesn't exist."""
+    path = TEMPLATE_DIR / name
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return None
+    entry = _template_registry.get(name)
+    if entry is None or entry[0] != mtime:
+        with _template_registry_lock:
+            entry = (mtime, CompiledTemplate(path.read_text(encoding="utf-8")))
+            _template_registry[name] = entry
+    return entry[1]
+
+@app.on_event("startup")
+async def _load_templates():
+    for path in TEMPLATE_DIR.glob("*.tex"):
+        get_template(path.name)
 
 def list_to_itemize(items: List[str]) -> str:
     if not items:
@@ -255,22 +2174,19 @@ def render_latex_from_data(template_str: str, data: Dict) -> str:
     certifications_section = list_to_itemize(data.get("certifications") or [])
 
     # Replace placeholders
-    tex = template_str
-    replacements = {
-        "{{NAME}}": name,
-        "{{EMAIL}}": email,
-        "{{PHONE}}": phone,
-        "{{LINKS}}": links,
-        "{{SUMMARY}}": summary,
-        "{{SKILLS}}": skills_section,
-        "{{EXPERIENCE}}": experience_section,
-        "{{PROJECTS}}": projects_section,
-        "{{EDUCATION}}": education_section,
-        "{{CERTIFICATIONS}}": certifications_section,
-    }
-    for k, v in replacements.items():
-        tex = tex.replace(k, v or "")
-    return tex
+    template = template_str if isinstance(template_str, CompiledTemplate) else compile_template(template_str)
+    return template.render({
+        "NAME": name,
+        "EMAIL": email,
+        "PHONE": phone,
+        "LINKS": links,
+        "SUMMARY": summary,
+        "SKILLS": skills_section,
+        "EXPERIENCE": experience_section,
+        "PROJECTS": projects_section,
+        "EDUCATION": education_section,
+        "CERTIFICATIONS": certifications_section,
+    })
 
 def find_latex_compiler() -> str:
     # Prefer latexmk, then pdflatex
@@ -279,36 +2195,353 @@ def find_latex_compiler() -> str:
             return cmd
     return ""
 
-async def compile_tex_to_pdf_bytes(tex_source: str) -> bytes:
-    workdir = Path(tempfile.mkdtemp(prefix="resume_tex_"))
-    tex_file = workdir / "output.tex"
-    tex_file.write_text(tex_source, encoding="utf-8")
-    compiler = find_latex_compiler()
+# ---------- Precompiled preamble formats ----------
+# The bundled templates only differ after \begin{document}, so their preambles are dumped once into
+# pdflatex format files and every compile loads the format instead of re-reading packages and macros.
+# Like mylatexformat's \endofdump, only the preamble up to the first package that cannot be preloaded
+# is dumped; that package and everything after it stay in the source and load normally on each run.
+BUNDLED_TEMPLATES = ("resume_template.tex", "resume.tex", "cover_letter.tex")
+# Packages that hook into the PDF output or the document start in ways a dumped format does not keep
+FORMAT_UNSAFE_PACKAGES = frozenset({"hyperref", "bookmark", "cleveref", "pdfx", "hyperxmp", "navigator"})
+_USEPACKAGE_RE = re.compile(r"\\(?:usepackage|RequirePackage)\s*(?:\[[^\]]*\])?\s*\{([^}]*)\}")
+FORMAT_DIR = CACHE_DIR / "formats"
+USE_PREAMBLE_FORMATS = os.getenv("LATEX_PREAMBLE_FORMATS", "1") != "0"
+# Formats of earlier template/TeX versions are removed at startup once they are this old; never on
+# publish, since another worker may still be running with (or just have built) a different version
+FORMAT_MAX_AGE_SECONDS = float(os.getenv("LATEX_FORMAT_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+_format_lock = asyncio.Lock()
+_format_failures = set()
+compile_timings = {"with_format": [0, 0.0], "without_format": [0, 0.0]}
+
+def split_preamble(tex_source: str) -> Optional[Tuple[str, str]]:
+    idx = tex_source.find("\\begin{document}")
+    if idx < 0:
+        return None
+    return tex_source[:idx], tex_source[idx:]
+
+def split_dumpable_preamble(preamble: str) -> Tuple[str, str]:
+    """Split a preamble into (part to dump into a format, part to keep loading at run time).
+    The cut goes before the first line that loads a FORMAT_UNSAFE_PACKAGES package.
+    """
+    offset = 0
+    for line in preamble.splitlines(keepends=True):
+        code = line.split("%", 1)[0]
+        for m in _USEPACKAGE_RE.finditer(code):
+            if FORMAT_UNSAFE_PACKAGES.intersection(p.strip() for p in m.group(1).split(",")):
+                return preamble[:offset], preamble[offset:]
+        offset += len(line)
+    return preamble, ""
+
+def _format_name(template_name: str, preamble: str) -> str:
+    # Version by preamble content and the pdflatex binary so template edits or TeX upgrades rebuild the format
+    pdflatex = shutil.which("pdflatex") or ""
+    engine_stamp = os.stat(pdflatex).st_mtime if pdflatex else 0
+    return f"{Path(template_name).stem}-{content_hash(preamble, engine_stamp)[:16]}"
+
+def _bundled_template_for(preamble: str) -> Optional[str]:
+    for name in BUNDLED_TEMPLATES:
+        template = get_template(name)
+        parts = split_preamble(template.source) if template else None
+        if parts and parts[0] == preamble:
+            return name
+    return None
+
+async def build_preamble_format(template_name: str, preamble: str) -> Optional[str]:
+    """Dump `preamble` (the dumpable part, see split_dumpable_preamble) into FORMAT_DIR/<name>.fmt (once)
+    and return the format name, or None if unavailable.
+    The pdflatex -ini run goes through compile_scheduler like any other TeX process.
+    """
+    if not shutil.which("pdflatex"):
+        return None
+    fmt_name = _format_name(template_name, preamble)
+    if (FORMAT_DIR / f"{fmt_name}.fmt").exists():
+        return fmt_name
+    async with _format_lock:
+        if (FORMAT_DIR / f"{fmt_name}.fmt").exists():
+            return fmt_name
+        if fmt_name in _format_failures:
+            return None
+        workdir = Path(tempfile.mkdtemp(prefix="resume_fmt_"))
+        try:
+            (workdir / f"{fmt_name}.tex").write_text(preamble + "\n\\dump\n", encoding="utf-8")
+            cmd = ["pdflatex", "-ini", "-interaction=nonstopmode", "-halt-on-error", f"-jobname={fmt_name}", "&pdflatex", f"{fmt_name}.tex"]
+            try:
+                returncode, _ = await compile_scheduler.run(cmd, cwd=str(workdir))
+            except HTTPException:
+                return None  # queue full or timed out: compile without a format this time, retry later
+            built = workdir / f"{fmt_name}.fmt"
+            if returncode != 0 or not built.exists():
+                print(f"Preamble format build failed for {template_name}; compiling without it.")
+                _format_failures.add(fmt_name)
+                return None
+            FORMAT_DIR.mkdir(parents=True, exist_ok=True)
+            # Copy next to the target then rename, so other worker processes never see a partial .fmt
+            staging = FORMAT_DIR / f".{fmt_name}.{os.getpid()}.tmp"
+            shutil.copyfile(built, staging)
+            os.replace(staging, FORMAT_DIR / f"{fmt_name}.fmt")
+            return fmt_name
+        except Exception:
+            _format_failures.add(fmt_name)
+            return None
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+async def preamble_format_for(tex_source: str) -> Optional[Tuple[str, str]]:
+    """Return (format_name, source to compile with it) when `tex_source` uses a bundled template preamble
+    with a usable format. The returned source is the undumped rest of the preamble plus the document body.
+    """
+    if not USE_PREAMBLE_FORMATS:
+        return None
+    parts = split_preamble(tex_source)
+    if not parts:
+        return None
+    template_name = _bundled_template_for(parts[0])
+    if not template_name:
+        return None
+    dumped, rest = split_dumpable_preamble(parts[0])
+    if "\\documentclass" not in dumped:
+        return None
+    fmt_name = await build_preamble_format(template_name, dumped)
+    return (fmt_name, rest + parts[1]) if fmt_name else None
+
+def sweep_old_formats(current: Iterable[str]) -> None:
+    """Remove formats other than `current` that were published more than FORMAT_MAX_AGE_SECONDS ago."""
+    keep = set(current)
+    cutoff = time.time() - FORMAT_MAX_AGE_SECONDS
+    for path in FORMAT_DIR.glob("*.fmt") if FORMAT_DIR.exists() else ():
+        try:
+            if path.stem not in keep and path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+        except OSError:
+            continue
+
+async def prewarm_preamble_formats() -> None:
+    current = []
+    for name in BUNDLED_TEMPLATES:
+        template = get_template(name)
+        if template is not None:
+            fmt = await preamble_format_for(template.source)
+            if fmt:
+                current.append(fmt[0])
+    await anyio.to_thread.run_sync(sweep_old_formats, current)
+
+def latex_command(compiler: str, tex_name: str, fmt_name: Optional[str] = None, extra_args: Tuple[str, ...] = ()) -> List[str]:
+    fmt_args = [f"-fmt={fmt_name}"] if fmt_name else []
+    if compiler == "latexmk":
+        cmd = ["latexmk", "-pdf", "-interaction=nonstopmode", "-halt-on-error", *extra_args]
+        if fmt_name:
+            cmd.append(f"-pdflatex=pdflatex -fmt={fmt_name} %O %S")
+        return cmd + [tex_name]
+    return ["pdflatex", *fmt_args, "-interaction=nonstopmode", *extra_args, tex_name]
+
+def latex_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    # Trailing separator keeps the default kpathsea search path after our format dir
+    env["TEXFORMATS"] = f"{FORMAT_DIR}{os.pathsep}{env.get('TEXFORMATS', '')}"
+    return env
+
+def record_compile_time(used_format: bool, seconds: float) -> None:
+    bucket = compile_timings["with_format" if used_format else "without_format"]
+    bucket[0] += 1
+    bucket[1] += seconds
+
+def compile_timing_stats() -> Dict:
+    return {
+        k: {"compiles": n, "avg_ms": round(total * 1000 / n, 1) if n else None}
+        for k, (n, total) in compile_timings.items()
+    }
+
+@app.on_event("startup")
+async def _prewarm_formats():
+    if USE_PREAMBLE_FORMATS and shutil.which("pdflatex"):
+        asyncio.get_running_loop().create_task(prewarm_preamble_formats())
+
+# ---------- Compile scheduler ----------
+class CompileQueueFull(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail="LaTeX compile queue is full, please retry shortly.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+class CompileScheduler:
+    """Central gate for TeX processes: caps concurrent compiles, bounds the wait queue and
+    enforces a per-job timeout. Rejects with 503 + Retry-After when the queue is full.
+    """
+    def __init__(self, max_concurrent: int, max_queue: int, timeout: float):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self._sem = asyncio.Semaphore(self.max_concurrent)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    def retry_after(self) -> int:
+        avg_run = self.total_run / self.completed if self.completed else 5.0
+        return max(1, int(avg_run * (self.waiting + 1) / self.max_concurrent + 0.5))
+
+    async def run(self, cmd: List[str], cwd: str, env: Optional[Dict[str, str]] = None,
+                  timeout: Optional[float] = None) -> Tuple[int, bytes]:
+        """Run one TeX process under the scheduler and return (returncode, combined stdout/stderr).
+        `timeout` caps this process (default: the per-job timeout); multi-pass jobs pass what is left of theirs.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if timeout <= 0:
+            self.timed_out += 1
+            raise HTTPException(status_code=504, detail=f"LaTeX compilation timed out after {self.timeout:g}s")
+        if self._sem.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise CompileQueueFull(self.retry_after())
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        wait = time.perf_counter() - queued_at
+        self.total_wait += wait
+        LATEX_QUEUE_WAIT_SECONDS.observe(wait)
+        self.max_wait = max(self.max_wait, wait)
+        self.running += 1
+        started = time.perf_counter()
+        try:
+            proc = await asyncio.create_subprocess_exec(*cmd, cwd=cwd, env=env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+            try:
+                stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                self.timed_out += 1
+                raise HTTPException(status_code=504, detail=f"LaTeX compilation timed out after {self.timeout:g}s")
+            return proc.returncode, stdout
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self.total_run += time.perf_counter() - started
+            self._sem.release()
+
+    def stats(self) -> Dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "timeout_s": self.timeout,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(self.total_wait * 1000 / self.completed, 1) if self.completed else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "avg_run_ms": round(self.total_run * 1000 / self.completed, 1) if self.completed else 0.0,
+        }
+
+compile_scheduler = CompileScheduler(
+    max_concurrent=worker_share(int(os.getenv("LATEX_MAX_CONCURRENT") or max(1, (os.cpu_count() or 2) // 2))),
+    max_queue=int(os.getenv("LATEX_MAX_QUEUE", "16")),
+    timeout=float(os.getenv("LATEX_COMPILE_TIMEOUT", "60")),
+)
+
+@app.get("/compile/stats")
+async def compile_stats():
+    """Compile scheduler queue depth, wait times and rejection counts."""
+    return compile_scheduler.stats()
+
+MAX_PDFLATEX_PASSES = 3
+_RERUN_REQUEST = re.compile(
+    r"Rerun to get|Label\(s\) may have changed|Please rerun LaTeX|Rerun LaTeX|"
+    r"No file [^\n]*\.(?:toc|lof|lot)\b"
+)
+_AUX_REFERENCES = re.compile(rb"\\(?:newlabel|bibcite|@writefile|citation)\b")
+
+def latex_needs_rerun(log_text: str, aux_before: Optional[bytes], aux_after: Optional[bytes]) -> bool:
+    """Decide whether another pdflatex pass can change the output."""
+    if _RERUN_REQUEST.search(log_text or ""):
+        return True
+    if aux_after is None or aux_after == aux_before:
+        return False
+    if aux_before is None:
+        # First pass: only cross-references/citations/TOC entries make a second pass worthwhile
+        return bool(_AUX_REFERENCES.search(aux_after))
+    return True
+
+class LatexCompileError(HTTPException):
+    def __init__(self, log: str):
+        super().__init__(status_code=500, detail=f"LaTeX compilation failed.\n{log[-4000:]}")
+        self.log = log
+
+async def run_latex_job(tex_source: str, jobname: str = "output", compiler: Optional[str] = None) -> Dict:
+    """Compile `tex_source` in a private scratch directory under the compile scheduler.
+    Returns {"pdf", "page_count", "log", "compiler"}; the scratch directory is always removed.
+    """
+    compiler = compiler or find_latex_compiler()
     if not compiler:
         raise HTTPException(status_code=500, detail="No LaTeX compiler found. Install MiKTeX/TeX Live and ensure pdflatex/latexmk in PATH.")
-    if compiler == "latexmk":
-        cmd = ["latexmk", "-pdf", "-interaction=nonstopmode", "-halt-on-error", tex_file.name]
-        runs = 1
-    else:
-        cmd = ["pdflatex", "-interaction=nonstopmode", tex_file.name]
-        runs = 2
-    for _ in range(runs):
-        proc = await asyncio.create_subprocess_exec(*cmd, cwd=str(workdir), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
-        stdout, _ = await proc.communicate()
-        if proc.returncode != 0:
-            log = stdout.decode(errors="ignore")
-            shutil.rmtree(workdir, ignore_errors=True)
-            raise HTTPException(status_code=500, detail=f"LaTeX compilation failed.\n{log[-4000:]}")
-    pdf_path = workdir / "output.pdf"
-    if not pdf_path.exists():
-        candidate = workdir / f"{tex_file.stem}.pdf"
-        if not candidate.exists():
-            shutil.rmtree(workdir, ignore_errors=True)
+    jobname = re.sub(r"[^A-Za-z0-9_-]+", "_", jobname or "output").strip("_") or "output"
+    fmt = await preamble_format_for(tex_source)
+    workdir = Path(tempfile.mkdtemp(prefix="resume_tex_"))
+    try:
+        tex_path = workdir / f"{jobname}.tex"
+        tex_path.write_text(fmt[1] if fmt else tex_source, encoding="utf-8")
+        cmd = latex_command(compiler, tex_path.name, fmt[0] if fmt else None)
+        aux_path = workdir / f"{jobname}.aux"
+        started = time.perf_counter()
+        # One deadline for the whole job, however many passes it takes
+        deadline = time.monotonic() + compile_scheduler.timeout
+        log_text = ""
+        passes = 0
+        # latexmk decides its own reruns; for bare pdflatex only rerun when the aux/log state asks for it
+        while True:
+            aux_before = aux_path.read_bytes() if aux_path.exists() else None
+            returncode, stdout = await compile_scheduler.run(cmd, cwd=str(workdir), env=latex_env(),
+                                                             timeout=deadline - time.monotonic())
+            log_text = stdout.decode(errors="ignore")
+            passes += 1
+            if returncode != 0:
+                raise LatexCompileError(log_text)
+            if compiler == "latexmk":
+                passes = max(1, len(re.findall(r"Run number \d+ of rule '(?:pdf)?latex'", log_text)))
+                break
+            aux_after = aux_path.read_bytes() if aux_path.exists() else None
+            if passes >= MAX_PDFLATEX_PASSES or not latex_needs_rerun(log_text, aux_before, aux_after):
+                break
+        record_compile_time(bool(fmt), time.perf_counter() - started)
+        LATEX_COMPILE_SECONDS.observe(time.perf_counter() - started, compiler=compiler, preamble_format="yes" if fmt else "no")
+        pdf_path = workdir / f"{jobname}.pdf"
+        if not pdf_path.exists():
             raise HTTPException(status_code=500, detail="PDF not generated by LaTeX compiler.")
-        pdf_path = candidate
-    data = pdf_path.read_bytes()
-    shutil.rmtree(workdir, ignore_errors=True)
-    return data
+        # Page count from the TeX log if available
+        page_count = 1
+        log_path = workdir / f"{jobname}.log"
+        if log_path.exists():
+            log_text = log_path.read_text(errors="ignore")
+            m = re.search(r"Output written on .*\((\d+) pages?[,)]", log_text)
+            if m:
+                page_count = int(m.group(1))
+        return {"pdf": pdf_path.read_bytes(), "page_count": page_count, "log": log_text, "compiler": compiler, "passes": passes}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+async def compile_latex(tex_source: str, jobname: str = "output", compiler: Optional[str] = None) -> Dict:
+    """Cache-aware run_latex_job. Adds "cached"; "passes" counts the TeX passes run for this call (0 on a hit)."""
+    cache_key = compile_cache_key(tex_source, "pdf")
+    # The disk tier does file I/O, so keep it off the event loop
+    cached = await anyio.to_thread.run_sync(compile_cache.get, cache_key)
+    if cached is not None:
+        return {"pdf": cached[0], "page_count": int(cached[1].get("page_count", 1)), "log": "", "passes": 0, "cached": True}
+    result = await run_latex_job(tex_source, jobname=jobname, compiler=compiler)
+    await anyio.to_thread.run_sync(compile_cache.put, cache_key, result["pdf"], {"page_count": result["page_count"]})
+    return {**result, "cached": False}
+
+async def compile_tex_to_pdf_bytes(tex_source: str) -> bytes:
+    return (await compile_latex(tex_source))["pdf"]
 
 def render_cover_letter_from_data(template_str: str, data: Dict) -> str:
     name = escape_latex(data.get("name", ""))
@@ -321,22 +2554,19 @@ def render_cover_letter_from_data(template_str: str, data: Dict) -> str:
     opening = escape_latex(data.get("opening", ""))
     skills_fit = escape_latex(data.get("skills_fit", ""))
     conclusion = escape_latex(data.get("conclusion", ""))
-    replacements = {
-        "{{NAME}}": name,
-        "{{EMAIL}}": email,
-        "{{PHONE}}": phone,
-        "{{LINKS}}": links,
-        "{{COMPANY}}": company,
-        "{{HIRING_MANAGER}}": hiring_manager,
-        "{{JOB_TITLE}}": job_title,
-        "{{OPENING}}": opening,
-        "{{SKILLS_FIT}}": skills_fit,
-        "{{CONCLUSION}}": conclusion,
-    }
-    tex = template_str
-    for k, v in replacements.items():
-        tex = tex.replace(k, v or "")
-    return tex
+    template = template_str if isinstance(template_str, CompiledTemplate) else compile_template(template_str)
+    return template.render({
+        "NAME": name,
+        "EMAIL": email,
+        "PHONE": phone,
+        "LINKS": links,
+        "COMPANY": company,
+        "HIRING_MANAGER": hiring_manager,
+        "JOB_TITLE": job_title,
+        "OPENING": opening,
+        "SKILLS_FIT": skills_fit,
+        "CONCLUSION": conclusion,
+    })
 
 def build_resume_prompt(resume_text: str, job_description: str) -> str:
     return (
@@ -357,46 +2587,41 @@ def build_cover_letter_prompt(resume_text: str, job_description: str, job_title:
 @app.post("/tailor_resume")
 async def tailor_resume_latex(payload: Dict):
     """Generate structured resume via Gemini (if data not provided), render LaTeX, compile to PDF and return base64 + latex."""
-    global gemini_api_key
     data = payload.get("resume_data") or payload.get("data")
     username = payload.get("username") or (data.get("name") if isinstance(data, dict) else "tailored")
+    llm_cached = False
     if data is None:
-        # Expect resume_text and job_description
-        resume_text = payload.get("resume_text", "")
+        # Expect resume_text (or document_id) and job_description
+        resume_text = await resolve_resume_text(payload)
         job_description = payload.get("job_description", "")
-        if not gemini_api_key:
-            raise HTTPException(status_code=400, detail="API key not set")
-        genai.configure(api_key=gemini_api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash')
         prompt = build_resume_prompt(resume_text, job_description)
-        resp = model.generate_content(prompt)
         try:
-            data = json.loads(resp.text)
-        except Exception as e:
+            data, llm_cached = await gemini_client.generate_cached(prompt, json.loads, bypass_cache=bool(payload.get("bypass_cache")))
+        except ValueError as e:
             raise HTTPException(status_code=500, detail=f"Gemini returned non-JSON: {str(e)}")
 
     # Render LaTeX
-    base_dir = Path(__file__).parent
-    template_path = base_dir / "templates" / "resume.tex"
-    if not template_path.exists():
+    template = get_template("resume.tex")
+    if template is None:
         raise HTTPException(status_code=500, detail="LaTeX template not found at backend/templates/resume.tex")
-    template_str = template_path.read_text(encoding="utf-8")
-    tex_source = render_latex_from_data(template_str, data)
-    pdf_bytes = await compile_tex_to_pdf_bytes(tex_source)
-    b64 = base64.b64encode(pdf_bytes).decode('ascii')
+    tex_source = render_latex_from_data(template, data)
+    compiled = await compile_latex(tex_source)
     safe_username = re.sub(r"[^A-Za-z0-9_-]+", "_", username or "tailored").strip("_") or "tailored"
-    return {
+    resp = {
         "status": "success",
         "filename": f"{safe_username}_resume.pdf",
-        "latex": tex_source,
-        "pdf_base64": b64,
+        **generated_artifacts(compiled["pdf"], f"{safe_username}_resume.pdf", tex_source),
         "data": data,
+        "latex_passes": compiled["passes"],
+        "llm_cached": llm_cached,
     }
+    if payload.get("inline"):
+        resp.update({"latex": tex_source, "pdf_base64": base64.b64encode(compiled["pdf"]).decode('ascii')})
+    return resp
 
 @app.post("/generate_cover_letter")
 async def generate_cover_letter(payload: Dict):
     """Generate tailored cover letter from resume/JD or structured paragraphs, return base64 PDF and LaTeX."""
-    global gemini_api_key
     # Inputs
     name = payload.get("name")
     email = payload.get("email")
@@ -404,29 +2629,23 @@ async def generate_cover_letter(payload: Dict):
     links = payload.get("links")
     company = payload.get("company")
     job_title = payload.get("job_title")
-    resume_text = payload.get("resume_text", "")
+    resume_text = await resolve_resume_text(payload)
     job_description = payload.get("job_description", "")
     paragraphs = payload.get("paragraphs")  # optional structured {opening, skills_fit, conclusion}
 
+    llm_cached = False
     if paragraphs is None:
-        if not gemini_api_key:
-            raise HTTPException(status_code=400, detail="API key not set")
-        genai.configure(api_key=gemini_api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash')
         prompt = build_cover_letter_prompt(resume_text, job_description, job_title or "", company or "")
-        resp = model.generate_content(prompt)
         try:
-            paragraphs = json.loads(resp.text)
-        except Exception as e:
+            paragraphs, llm_cached = await gemini_client.generate_cached(prompt, json.loads, bypass_cache=bool(payload.get("bypass_cache")))
+        except ValueError as e:
             raise HTTPException(status_code=500, detail=f"Gemini returned non-JSON: {str(e)}")
 
     # Load template
-    base_dir = Path(__file__).parent
-    template_path = base_dir / "templates" / "cover_letter.tex"
-    if not template_path.exists():
+    template = get_template("cover_letter.tex")
+    if template is None:
         raise HTTPException(status_code=500, detail="LaTeX template not found at backend/templates/cover_letter.tex")
-    template_str = template_path.read_text(encoding="utf-8")
-    tex = render_cover_letter_from_data(template_str, {
+    tex = render_cover_letter_from_data(template, {
         "name": name or "",
         "email": email or "",
         "phone": phone or "",
@@ -437,70 +2656,103 @@ async def generate_cover_letter(payload: Dict):
         "skills_fit": paragraphs.get("skills_fit", ""),
         "conclusion": paragraphs.get("conclusion", ""),
     })
-    pdf_bytes = await compile_tex_to_pdf_bytes(tex)
-    b64 = base64.b64encode(pdf_bytes).decode('ascii')
+    compiled = await compile_latex(tex)
     safe_username = re.sub(r"[^A-Za-z0-9_-]+", "_", (name or "candidate")).strip("_") or "candidate"
-    return {
+    resp = {
         "status": "success",
         "filename": f"{safe_username}_cover_letter.pdf",
-        "latex": tex,
-        "pdf_base64": b64,
+        **generated_artifacts(compiled["pdf"], f"{safe_username}_cover_letter.pdf", tex),
         "paragraphs": paragraphs,
+        "latex_passes": compiled["passes"],
+        "llm_cached": llm_cached,
     }
+    if payload.get("inline"):
+        resp.update({"latex": tex, "pdf_base64": base64.b64encode(compiled["pdf"]).decode('ascii')})
+    return resp
+
+# ---------- Plain downloads ----------
+DOWNLOAD_RENDER_VERSION = "1"
+
+@lru_cache(maxsize=1)
+def _download_styles():
+    return rl_styles.getSampleStyleSheet()
+
+@lru_cache(maxsize=1)
+def _default_docx_template() -> bytes:
+    # python-docx re-reads its bundled default.docx from disk on every Document(); keep the bytes
+    buf = io.BytesIO()
+    docx.Document().save(buf)
+    return buf.getvalue()
+
+def render_txt_download(text: str) -> bytes:
+    return text.encode("utf-8")
+
+def render_docx_download(text: str) -> bytes:
+    doc = docx.Document(io.BytesIO(_default_docx_template()))
+    for paragraph in text.split('\n'):
+        if paragraph.strip():
+            doc.add_paragraph(paragraph.strip())
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+def render_pdf_download(text: str) -> bytes:
+    buf = io.BytesIO()
+    doc = rl_platypus.SimpleDocTemplate(buf, pagesize=rl_pagesizes.letter)
+    normal = _download_styles()['Normal']
+    story = []
+    for paragraph in text.split('\n'):
+        if paragraph.strip():
+            story.append(rl_platypus.Paragraph(paragraph.strip(), normal))
+            story.append(rl_platypus.Spacer(1, 12))
+    doc.build(story)
+    return buf.getvalue()
+
+DOWNLOAD_FORMATS = {
+    "txt": ("text/plain", render_txt_download),
+    "docx": ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", render_docx_download),
+    "pdf": ("application/pdf", render_pdf_download),
+}
+
+download_cache = TieredCache("download", max_items=int(os.getenv("DOWNLOAD_CACHE_MAX_ITEMS", "64")))
+
+def render_download(text: str, format: str) -> Tuple[bytes, bool]:
+    """Render text in the given download format, cached by (format, content hash). Returns (bytes, from_cache)."""
+    key = content_hash(DOWNLOAD_RENDER_VERSION, format, text)
+    cached = download_cache.get(key)
+    if cached is not None:
+        return cached[0], True
+    content = DOWNLOAD_FORMATS[format][1](text)
+    download_cache.put(key, content, {})
+    return content, False
 
 @app.post("/download/{format}")
 async def download_resume(
     format: str,
-    resume_text: str = Form(...),
-    filename: str = Form(default="tailored_resume")
+    resume_text: Optional[str] = Form(default=None),
+    filename: str = Form(default="tailored_resume"),
+    document_id: Optional[str] = Form(default=None)
 ):
-    """Download tailored resume in specified format (pdf, docx, txt)"""
+    """Download tailored resume in specified format (pdf, docx, txt). Send resume_text or a document_id from /analyze."""
+    resume_text = await resolve_resume_text({"resume_text": resume_text, "document_id": document_id})
+    if not resume_text:
+        raise HTTPException(status_code=400, detail="resume_text or document_id is required")
+    if format not in DOWNLOAD_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format. Use: txt, docx, or pdf")
     try:
-        # Helper functions to offload blocking IO / CPU work
-        def _create_txt_file(text: str) -> str:
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt', encoding='utf-8') as f:
-                f.write(text)
-                return f.name
-
-        def _create_docx_file(text: str) -> str:
-            doc = Document()
-            for paragraph in text.split('\n'):
-                if paragraph.strip():
-                    doc.add_paragraph(paragraph.strip())
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as f:
-                doc.save(f.name)
-                return f.name
-
-        def _create_pdf_file(text: str) -> str:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as f:
-                doc = SimpleDocTemplate(f.name, pagesize=letter)
-                styles = getSampleStyleSheet()
-                story = []
-                for paragraph in text.split('\n'):
-                    if paragraph.strip():
-                        story.append(Paragraph(paragraph.strip(), styles['Normal']))
-                        story.append(Spacer(1, 12))
-                doc.build(story)
-                return f.name
-
-        if format == "txt":
-            temp_path = await anyio.to_thread.run_sync(_create_txt_file, resume_text)
-            return FileResponse(temp_path, media_type='text/plain', filename=f"{filename}.txt")
-        elif format == "docx":
-            temp_path = await anyio.to_thread.run_sync(_create_docx_file, resume_text)
-            return FileResponse(temp_path, media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document', filename=f"{filename}.docx")
-        elif format == "pdf":
-            temp_path = await anyio.to_thread.run_sync(_create_pdf_file, resume_text)
-            return FileResponse(temp_path, media_type='application/pdf', filename=f"{filename}.pdf")
-        else:
-            raise HTTPException(status_code=400, detail="Invalid format. Use: txt, docx, or pdf")
+        # Rendered in memory off the event loop; nothing touches the disk
+        content, cached = await anyio.to_thread.run_sync(render_download, resume_text, format)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
-
-def _ensure_output_dir() -> Path:
-    out = Path(__file__).parent / "output"
-    out.mkdir(parents=True, exist_ok=True)
-    return out
+    safe_filename = re.sub(r'[^A-Za-z0-9_. -]+', '_', filename or "tailored_resume")
+    return Response(
+        content=content,
+        media_type=DOWNLOAD_FORMATS[format][0],
+        headers={
+            "Content-Disposition": f'attachment; filename="{safe_filename}.{format}"',
+            "X-Render-Cached": "1" if cached else "0",
+        },
+    )
 
 # ---------- Overleaf-style resume rendering ----------
 
@@ -589,32 +2841,27 @@ def render_resume_tex_overleaf(data: Dict) -> str:
     certs = data.get("certifications") or []
     certs_tex = " \\tabitem ".join(escape_latex(str(x)) for x in certs) if certs else ""
 
-    base_dir = Path(__file__).parent
-    strict_tpl = base_dir / "templates" / "resume_template.tex"
-    if strict_tpl.exists():
-        tpl = strict_tpl.read_text(encoding="utf-8")
-        repl = {
-            "{{NAME}}": name,
-            "{{GITHUB}}": github,
-            "{{LINKEDIN}}": linkedin,
-            "{{WEBSITE}}": website,
-            "{{EMAIL}}": email,
-            "{{PHONE}}": phone,
-            "{{SUMMARY}}": summary,
-            "{{WORK}}": work_tex,
-            "{{PROJECTS}}": projects_tex,
-            "{{EDU_ROWS}}": edu_tex,
-            "{{PUBLICATIONS}}": pubs_tex,
-            "{{SKILLS_LEFT}}": skills_left,
-            "{{SKILLS_RIGHT}}": skills_right,
-            "{{CERTIFICATIONS}}": certs_tex,
-        }
-        for k, v in repl.items():
-            tpl = tpl.replace(k, v or "")
-        return tpl
+    strict_tpl = get_template("resume_template.tex")
+    if strict_tpl is not None:
+        return strict_tpl.render({
+            "NAME": name,
+            "GITHUB": github,
+            "LINKEDIN": linkedin,
+            "WEBSITE": website,
+            "EMAIL": email,
+            "PHONE": phone,
+            "SUMMARY": summary,
+            "WORK": work_tex,
+            "PROJECTS": projects_tex,
+            "EDU_ROWS": edu_tex,
+            "PUBLICATIONS": pubs_tex,
+            "SKILLS_LEFT": skills_left,
+            "SKILLS_RIGHT": skills_right,
+            "CERTIFICATIONS": certs_tex,
+        })
     # Fallback to simple template (resume.tex) if strict template is missing
-    simple_tpl = base_dir / "templates" / "resume.tex"
-    if not simple_tpl.exists():
+    simple_tpl = get_template("resume.tex")
+    if simple_tpl is None:
         raise HTTPException(status_code=500, detail="LaTeX template not found (expected templates/resume_template.tex or templates/resume.tex)")
     # Convert schema to simple renderer expected keys (direct mapping)
     def split_date(d: str):
@@ -647,7 +2894,7 @@ def render_resume_tex_overleaf(data: Dict) -> str:
         ],
         "certifications": [escape_latex(c) for c in (data.get("certifications") or [])]
     }
-    return render_latex_from_data(simple_tpl.read_text(encoding="utf-8"), simple_data)
+    return render_latex_from_data(simple_tpl, simple_data)
 
 def predict_overflow_lines(data: Dict) -> int:
     """Very rough line estimate to keep to one page.
@@ -674,72 +2921,256 @@ def prune_for_single_page(data: Dict) -> Dict:
     pruned["education"] = (pruned.get("education") or [])[:2]
     return pruned
 
+# ---------- One-page layout estimator ----------
+# Advance widths of Latin Modern Roman / cmr10 in 1/1000 em (same metrics as the TFM files).
+_LMR_WIDTHS = {
+    **dict(zip("abcdefghijklmnopqrstuvwxyz", (500, 556, 444, 556, 444, 306, 500, 556, 278, 306, 528, 278, 833,
+                                             556, 500, 556, 528, 392, 394, 389, 556, 528, 722, 528, 528, 444))),
+    **dict(zip("ABCDEFGHIJKLMNOPQRSTUVWXYZ", (750, 708, 722, 764, 681, 653, 785, 750, 361, 514, 778, 625, 917,
+                                             750, 778, 681, 778, 736, 556, 722, 750, 750, 1028, 750, 750, 611))),
+    **{d: 500 for d in "0123456789"},
+    **dict(zip(".,:;!?'\"()[]-/@&%$#+=*|_~<>", (278, 278, 278, 278, 278, 472, 278, 500, 389, 389, 278, 278, 333, 500,
+                                                  778, 778, 833, 500, 833, 778, 778, 500, 278, 500, 500, 500, 500))),
+    "–": 500, "—": 1000, "•": 500, "’": 278, "“": 500, "”": 500,
+}
+_LMR_SPACE = 333
+_LMR_DEFAULT = 500
+_BOLD_FACTOR = 1.1  # cmbx10 runs ~10% wider than cmr10
+
+# Geometry of templates/resume_template.tex: 11pt article on a4paper with margin=1.4cm
+_PT_PER_CM = 72.27 / 2.54
+RESUME_LAYOUT = {
+    "text_width": (21.0 - 2 * 1.4) * _PT_PER_CM,
+    "text_height": (29.7 - 2 * 1.4) * _PT_PER_CM,
+    "font_size": 10.95,
+    "baseline": 13.6,          # \normalsize baselineskip at 11pt
+    "small_size": 10.0,
+    "small_baseline": 12.0,
+    "large_baseline": 14.5,
+    "LARGE_baseline": 22.0,
+    "section_rule": 2 + 0.8 + 4,
+    "item_indent": 1.5 * 10.95,
+    "itemize_topsep": 2.0,
+    "job_gap": 0.4 * 10.95,
+    "project_gap": 0.3 * 10.95,
+}
+
+def text_width_pt(text: str, size: float, bold: bool = False) -> float:
+    units = sum(_LMR_SPACE if ch == " " else _LMR_WIDTHS.get(ch, _LMR_DEFAULT) for ch in text or "")
+    return units * size / 1000.0 * (_BOLD_FACTOR if bold else 1.0)
+
+def wrapped_line_count(text: str, width: float, size: float, bold: bool = False) -> int:
+    """Greedy line breaking with natural inter-word spacing; an empty string takes no lines."""
+    words = (text or "").split()
+    if not words:
+        return 0
+    space = _LMR_SPACE * size / 1000.0
+    lines, current = 1, 0.0
+    for word in words:
+        w = text_width_pt(word, size, bold)
+        if current and current + space + w > width:
+            lines += 1
+            current = w
+        else:
+            current = current + space + w if current else w
+        while current > width:  # overlong tokens such as URLs
+            lines += 1
+            current -= width
+    return lines
+
+def estimate_resume_height(data: Dict) -> float:
+    """Predict the rendered height (pt) of `data` in resume_template.tex."""
+    L = RESUME_LAYOUT
+    width, size, base = L["text_width"], L["font_size"], L["baseline"]
+    section = L["large_baseline"] + L["section_rule"]
+    contact = data.get("contact") or {}
+    contact_line = " | ".join(str(contact.get(k) or "") for k in ("email", "phone", "website", "github", "linkedin"))
+    height = L["LARGE_baseline"] + 2 + max(1, wrapped_line_count(contact_line, width, L["small_size"])) * L["small_baseline"]
+
+    height += section + wrapped_line_count(str(data.get("summary") or ""), width, size) * base
+
+    height += section
+    for exp in data.get("experience") or []:
+        head = f"{exp.get('title', '')} — {exp.get('company', '')}  {exp.get('date', '')}"
+        height += max(1, wrapped_line_count(head, width, size, bold=True)) * base
+        points = [p for p in (exp.get("points") or []) if p]
+        if points:
+            height += 2 * L["itemize_topsep"]
+            height += sum(wrapped_line_count(str(p), width - L["item_indent"], size) for p in points) * base
+        height += L["job_gap"]
+
+    height += section
+    for pr in data.get("projects") or []:
+        head = f"{pr.get('title', '')}  {pr.get('link', '')}"
+        height += max(1, wrapped_line_count(head, width, size, bold=True)) * base
+        height += wrapped_line_count(str(pr.get("desc") or ""), width, size) * base + L["project_gap"]
+
+    height += section
+    for ed in data.get("education") or []:
+        fixed = text_width_pt(str(ed.get("date") or ""), size) + text_width_pt(f"(GPA: {ed.get('gpa', '')})", size) + 24
+        row = f"{ed.get('degree', '')} at {ed.get('institute', '')}"
+        height += max(1, wrapped_line_count(row, max(width - fixed, width / 3), size)) * base
+
+    height += section
+    column = (width - size) / 2
+    left = " • ".join(str(x) for x in (data.get("skills_left") or []))
+    right = " • ".join(str(x) for x in (data.get("skills_right") or []))
+    height += max(1, wrapped_line_count(left, column, size), wrapped_line_count(right, column, size)) * base
+
+    pubs = [p.get("citation", "") for p in (data.get("publications") or []) if isinstance(p, dict)]
+    if pubs:
+        height += 2 * L["itemize_topsep"] + sum(wrapped_line_count(c, width - L["item_indent"], size) for c in pubs) * base
+    certs = " • ".join(str(x) for x in (data.get("certifications") or []))
+    height += wrapped_line_count(certs, width, size) * base
+    return height
+
+def _skills_step(data: Dict, keep: int):
+    """Drop the last skill of the longer column while it has more than `keep` items."""
+    left, right = data.get("skills_left") or [], data.get("skills_right") or []
+    column = "skills_left" if len(left) >= len(right) else "skills_right"
+    if len(data.get(column) or []) > keep:
+        return f"{column}: drop last", lambda: data[column].pop()
+    return None
+
+def _next_pruning_step(data: Dict):
+    """Return the least destructive remaining (description, mutate) step, or None when nothing is left to prune.
+    Every step removes an item or shortens text, so repeated application always terminates.
+    """
+    exps = data.get("experience") or []
+    # 1. Trim bullets of the oldest roles first, never below two
+    for idx in range(len(exps) - 1, -1, -1):
+        if len(exps[idx].get("points") or []) > 2:
+            return f"experience[{idx}]: drop last bullet", lambda i=idx: exps[i]["points"].pop()
+    if len(data.get("publications") or []) > 1:
+        return "publications: drop last", lambda: data["publications"].pop()
+    if len(data.get("certifications") or []) > 2:
+        return "certifications: drop last", lambda: data["certifications"].pop()
+    if len(data.get("projects") or []) > 2:
+        return "projects: drop oldest", lambda: data["projects"].pop()
+    if len(data.get("education") or []) > 2:
+        return "education: drop oldest", lambda: data["education"].pop()
+    step = _skills_step(data, 6)
+    if step:
+        return step
+    # 2. Down to one bullet, still oldest roles first
+    for idx in range(len(exps) - 1, -1, -1):
+        if len(exps[idx].get("points") or []) > 1:
+            return f"experience[{idx}]: drop last bullet", lambda i=idx: exps[i]["points"].pop()
+    if len(data.get("projects") or []) > 1:
+        return "projects: drop oldest", lambda: data["projects"].pop()
+    if data.get("publications"):
+        return "publications: drop last", lambda: data["publications"].pop()
+    step = _skills_step(data, 3)
+    if step:
+        return step
+    if len(exps) > 1:
+        return "experience: drop oldest role", lambda: exps.pop()
+    summary = str(data.get("summary") or "")
+    if len(summary) > 160:
+        def shorten():
+            # Hard cap at 157 chars so the result (with "...") is always <= 160, even without spaces (CJK, long tokens)
+            cut = summary[:157]
+            if " " in cut:
+                cut = cut.rsplit(" ", 1)[0]
+            data["summary"] = cut.rstrip(",;:") + "..."
+        return "summary: shorten", shorten
+    return None
+
+# Backstop for the pruning loop; each step already makes progress, so this is never reached on sane input
+MAX_PRUNING_STEPS = 200
+
+def fit_resume_to_page(data: Dict, budget_scale: float = 0.97) -> Tuple[Dict, Dict]:
+    """Apply the least-destructive pruning that makes `data` fit one page according to the layout estimator.
+    Returns (pruned_copy, report).
+    """
+    fitted = json.loads(json.dumps(data or {}))  # deep copy
+    # Mirror the hard caps applied by render_resume_tex_overleaf
+    fitted["experience"] = truncate_list(fitted.get("experience") or [], 3)
+    for exp in fitted["experience"]:
+        exp["points"] = truncate_list(exp.get("points") or [], 3)
+    fitted["projects"] = truncate_list(fitted.get("projects") or [], 3)
+    fitted["education"] = truncate_list(fitted.get("education") or [], 3)
+    fitted["publications"] = truncate_list(fitted.get("publications") or [], 2)
+    fitted["certifications"] = truncate_list(fitted.get("certifications") or [], 3)
+    # More skills than this never fit one page; cap up front so pruning stays a handful of steps
+    for column in ("skills_left", "skills_right"):
+        if column in fitted:
+            fitted[column] = truncate_list(fitted.get(column) or [], 24)
+
+    budget = RESUME_LAYOUT["text_height"] * budget_scale
+    initial = height = estimate_resume_height(fitted)
+    pruned = []
+    while height > budget and len(pruned) < MAX_PRUNING_STEPS:
+        step = _next_pruning_step(fitted)
+        if step is None:
+            break
+        pruned.append(step[0])
+        step[1]()
+        height = estimate_resume_height(fitted)
+    return fitted, {
+        "estimated_height_pt": round(initial, 1),
+        "fitted_height_pt": round(height, 1),
+        "budget_pt": round(budget, 1),
+        "fits": height <= budget,
+        "pruned": pruned,
+    }
+
 # ---------- Compilation helpers ----------
 async def compile_overleaf_pdf(latex_str: str, out_pdf_name: str) -> bytes:
-    out_dir = _ensure_output_dir()
-    tex_path = out_dir / (Path(out_pdf_name).stem + ".tex")
-    tex_path.write_text(latex_str, encoding="utf-8")
-    # Use latexmk if available else pdflatex (twice)
+    return (await compile_overleaf(latex_str, out_pdf_name))["pdf"]
+
+async def compile_overleaf(latex_str: str, out_pdf_name: str, pipeline: str = "compile") -> Dict:
+    """Compile locally (latexmk, else pdflatex) with latexonline.cc as fallback; returns the compile_latex dict.
+    Stage timings and the backend that produced the PDF are recorded under the given pipeline label.
+    """
+    async def remote() -> Dict:
+        cache_key = compile_cache_key(latex_str, "pdf")
+        cached = await anyio.to_thread.run_sync(compile_cache.get, cache_key)
+        if cached is not None:
+            PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend="compile_cache", outcome="success")
+            return {"pdf": cached[0], "page_count": int(cached[1].get("page_count", 1)), "log": "", "passes": 0, "cached": True}
+        try:
+            with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage="latexonline"):
+                pdf_bytes = await run_sync_profiled(compile_via_latexonline, latex_str)
+        except Exception:
+            PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend="latexonline", outcome="failure")
+            raise
+        PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend="latexonline", outcome="success")
+        await anyio.to_thread.run_sync(compile_cache.put, cache_key, pdf_bytes, {"page_count": 0})
+        return {"pdf": pdf_bytes, "page_count": 0, "log": "", "passes": 0, "cached": False, "compiler": "latexonline"}
+
     compiler = find_latex_compiler()
     if not compiler:
         # Remote fallback
         try:
-            return compile_via_latexonline(latex_str)
+            return await remote()
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"No local LaTeX compiler and remote compile failed: {str(e)}")
-    if compiler == "latexmk":
-        cmd = ["latexmk", "-pdf", "-interaction=nonstopmode", "-halt-on-error", tex_path.name]
-        runs = 1
-    else:
-        cmd = ["pdflatex", "-interaction=nonstopmode", tex_path.name]
-        runs = 2
-    for _ in range(runs):
-        proc = await asyncio.create_subprocess_exec(*cmd, cwd=str(out_dir), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
-        stdout, _ = await proc.communicate()
-        if proc.returncode != 0:
-            # Try remote fallback if local compile fails
-            try:
-                return compile_via_latexonline(latex_str)
-            except Exception as e:
-                log = stdout.decode(errors="ignore")
-                raise HTTPException(status_code=500, detail=f"Local LaTeX compile failed and remote fallback error: {str(e)}\n{log[-2000:]}")
-    pdf_path = out_dir / (Path(out_pdf_name).stem + ".pdf")
-    if not pdf_path.exists():
-        raise HTTPException(status_code=500, detail="Compiled PDF not found")
-    return pdf_path.read_bytes()
-
-def compile_with_latexmk(latex_str: str, jobname: str = "resume") -> (bytes, int, str):
-    """Compile LaTeX using latexmk with output dir 'output' and return (pdf_bytes, page_count, log_text)."""
-    out_dir = _ensure_output_dir()
-    tex_path = out_dir / f"{jobname}.tex"
-    tex_path.write_text(latex_str, encoding="utf-8")
-    # latexmk command
-    cmd = [
-        "latexmk", "-pdf", "-halt-on-error", "-interaction=nonstopmode",
-        "-output-directory", str(out_dir), tex_path.name
-    ]
-    # Execute
-    proc = subprocess.run(cmd, cwd=str(out_dir), capture_output=True, text=True)
-    log_text = (proc.stdout or "") + "\n" + (proc.stderr or "")
-    if proc.returncode != 0:
-        raise HTTPException(status_code=500, detail=f"LaTeX compilation failed")
-    pdf_path = out_dir / f"{jobname}.pdf"
-    if not pdf_path.exists():
-        raise HTTPException(status_code=500, detail="PDF not generated by LaTeX compiler.")
-    # Page count from log if available
-    page_count = 1
     try:
-        # latexmk writes a .log next to pdf
-        log_path = out_dir / f"{jobname}.log"
-        if log_path.exists():
-            log = log_path.read_text(errors="ignore")
-            m = re.search(r"Output written on .*\((\d+) pages?\)", log)
-            if m:
-                page_count = int(m.group(1))
-            log_text = log
-    except Exception:
-        pass
-    return pdf_path.read_bytes(), page_count, log_text
+        with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage=compiler):
+            result = await compile_latex(latex_str, jobname=Path(out_pdf_name).stem)
+        PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend=pdf_backend_of(result), outcome="success")
+        return result
+    except CompileQueueFull:
+        PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend=compiler, outcome="rejected")
+        raise
+    except LatexCompileError as compile_error:
+        PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend=compiler, outcome="failure")
+        # Try remote fallback if local compile fails
+        try:
+            return await remote()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Local LaTeX compile failed and remote fallback error: {str(e)}\n{compile_error.log[-2000:]}")
+
+async def compile_with_latexmk(latex_str: str, jobname: str = "resume") -> (bytes, int, str):
+    """Compile LaTeX using latexmk in a private scratch directory and return (pdf_bytes, page_count, log_text).
+    Results are served from the compile cache when the same source was compiled before (log_text is empty then).
+    """
+    try:
+        result = await compile_latex(latex_str, jobname=jobname, compiler="latexmk")
+    except LatexCompileError:
+        raise HTTPException(status_code=500, detail=f"LaTeX compilation failed")
+    return result["pdf"], result["page_count"], result["log"]
 
 def compile_via_latexonline(tex_source: str) -> bytes:
     """Compile LaTeX using latexonline.cc as a fallback. Returns PDF bytes."""
@@ -792,21 +3223,21 @@ def render_simple_pdf_from_data(data: Dict) -> bytes:
     This is a last-resort fallback when LaTeX compilation is unavailable or fails.
     """
     buf = io.BytesIO()
-    doc = SimpleDocTemplate(
+    doc = rl_platypus.SimpleDocTemplate(
         buf,
-        pagesize=letter,
+        pagesize=rl_pagesizes.letter,
         leftMargin=36,
         rightMargin=36,
         topMargin=36,
         bottomMargin=36,
     )
-    styles = getSampleStyleSheet()
+    styles = rl_styles.getSampleStyleSheet()
     story = []
 
     def add_para(text: str, style_name: str = 'Normal', space_after: int = 6):
         if text:
-            story.append(Paragraph(text, styles[style_name]))
-            story.append(Spacer(1, space_after))
+            story.append(rl_platypus.Paragraph(text, styles[style_name]))
+            story.append(rl_platypus.Spacer(1, space_after))
 
     # Header
     name = data.get('name') or 'Candidate Name'
@@ -838,7 +3269,7 @@ def render_simple_pdf_from_data(data: Dict) -> bytes:
             add_para(f"<b>{title}</b> — {company} <font size=9 color=grey>({date})</font>", 'Normal', 2)
             for p in (e.get('points') or e.get('bullets') or [])[:3]:
                 add_para(f"• {p}", 'Normal', 1)
-            story.append(Spacer(1, 6))
+            story.append(rl_platypus.Spacer(1, 6))
 
     # Projects
     projs = data.get('projects') or []
@@ -937,19 +3368,31 @@ def fallback_resume_data(resume_text: str, job_description: str) -> Dict:
 
 # ---------- New Endpoints ----------
 
-@app.post("/tailor_resume_overleaf")
-async def tailor_resume_overleaf(payload: Dict):
-    """Call Gemini to produce structured JSON per schema, render into Overleaf template, compile PDF, return base64+LaTeX+ATS.
-    Returns HTTP 500 on failure with a clear message.
+async def tailor_overleaf_events(payload: Dict, preview: bool = False):
+    """The /tailor_resume_overleaf pipeline as an async generator of (event, data) pairs, one per stage:
+    ats_before, resume_json, latex, preview_pdf (only when preview is set), pdf, ats_after and finally
+    result with the complete response. Input errors are raised before the first event.
     """
+    pipeline = "tailor_resume_overleaf"
     try:
-        global gemini_api_key
-        resume_text = payload.get("resume_text", "")
+        doc = await get_document(payload.get("document_id"))
+        resume_text = payload.get("resume_text") or (doc["text"] if doc else "")
         job_description = payload.get("job_description") or payload.get("jd_text", "")
         username = payload.get("username", "candidate")
 
-        # ATS before
-        ats_before = calculate_ats_score(resume_text, job_description).get("score", 0)
+        # Enforce Gemini usage and fail if unavailable/invalid
+        if not current_api_key():
+            raise HTTPException(status_code=400, detail="API key not set")
+        if not (resume_text or "").strip():
+            raise HTTPException(status_code=400, detail="resume_text is required")
+        if not (job_description or "").strip():
+            raise HTTPException(status_code=400, detail="job_description is required")
+
+        # ATS before (reuse the stored keyword set when the resume came from the document store)
+        stored_keywords = doc["keywords"] if doc and not payload.get("resume_text") else None
+        with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage="ats_before"):
+            ats_before = calculate_ats_score(resume_text, job_description, stored_keywords).get("score", 0)
+        yield "ats_before", {"ats_before": ats_before}
 
         # Gemini prompt per spec
         prompt = (
@@ -965,30 +3408,26 @@ async def tailor_resume_overleaf(payload: Dict):
             " Maintain factual accuracy (no fabricated roles), prioritize JD-aligned keywords, concise bullet points (max 2 lines each), and fit one A4 page in LaTeX. Dates like 'Jan 2023 – Present'.\n\n"
             f"Original Resume:\n{resume_text}\n\nJob Description:\n{job_description}"
         )
-        # Enforce Gemini usage and fail if unavailable/invalid
-        if not gemini_api_key:
-            raise HTTPException(status_code=400, detail="API key not set")
-        if not (resume_text or "").strip():
-            raise HTTPException(status_code=400, detail="resume_text is required")
-        if not (job_description or "").strip():
-            raise HTTPException(status_code=400, detail="job_description is required")
         try:
-            genai.configure(api_key=gemini_api_key)
-            model = genai.GenerativeModel('gemini-1.5-flash', generation_config={"temperature":0.4})
-            resp = model.generate_content(prompt)
-            data = extract_json_object(getattr(resp, 'text', '') or '')
+            with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage="llm"):
+                data, llm_cached = await gemini_client.generate_cached(
+                    prompt, extract_json_object, temperature=0.4, bypass_cache=bool(payload.get("bypass_cache")))
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Gemini generation failed: {e}")
 
-        # Enforce stricter pruning if overflow predicted
-        if predict_overflow_lines(data) > 28:
-            data = prune_for_single_page(data)
+        # Prune with the layout estimator before compiling so one compile is usually enough
+        with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage="layout_fit"):
+            data, layout = fit_resume_to_page(data)
+        yield "resume_json", {"data": data, "layout": layout, "llm_cached": llm_cached}
 
         # Render LaTeX and compile; do not embed any debug/source blocks
         include_source_in_pdf = False
-        tex = render_resume_tex_overleaf(data)
-        # guard: strip accidental \newpage or \clearpage
-        tex = re.sub(r"\\(newpage|clearpage)\b", "", tex)
+        with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage="templating"):
+            tex = render_resume_tex_overleaf(data)
+            # guard: strip accidental \newpage or \clearpage
+            tex = re.sub(r"\\(newpage|clearpage)\b", "", tex)
         if not tex or not tex.strip().endswith("\\end{document}"):
             raise HTTPException(status_code=500, detail="latex_source empty after templating")
         # Diagnostic: print first 200 chars
@@ -996,47 +3435,101 @@ async def tailor_resume_overleaf(payload: Dict):
             print("LATEX[200]: ", tex[:200])
         except Exception:
             pass
+        inline = bool(payload.get("inline"))
+        tex_filename = f"{re.sub(r'[^A-Za-z0-9_-]+','_',username)}_resume.tex"
+        tex_artifact = artifact_store.put_text(tex, "application/x-tex", tex_filename)
+        yield "latex", {"tex_artifact": tex_artifact, **({"latex_source": tex} if inline else {})}
+        latex_stored = tex
 
         # Fast mode: optionally skip LaTeX compilation for speed
-        pdf_b64 = ""
+        pdf_bytes = b""
         page_count = 0
+        latex_passes = 0
         fast = bool(payload.get("fast") or payload.get("fast_mode"))
         if fast:
             try:
-                pdf_bytes = render_simple_pdf_from_data(data)
+                with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage="reportlab"):
+                    pdf_bytes = await run_sync_profiled(render_simple_pdf_from_data, data)
                 page_count = 1
-                pdf_b64 = "data:application/pdf;base64," + base64.b64encode(pdf_bytes).decode('ascii')
+                PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend="reportlab_fast", outcome="success")
             except Exception as e_fast:
+                PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend="reportlab_fast", outcome="failure")
                 raise HTTPException(status_code=500, detail=f"Fast generation failed: {e_fast}")
         else:
+            if preview:
+                # Quick reportlab rendering so the client has something to show while TeX runs
+                try:
+                    with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage="preview_pdf"):
+                        preview_bytes = await run_sync_profiled(render_simple_pdf_from_data, data)
+                    preview_artifact = artifact_store.put(preview_bytes, "application/pdf", "preview.pdf")
+                    yield "preview_pdf", {"pdf_artifact": preview_artifact}
+                except Exception:
+                    pass
             # Compile to PDF (latexmk preferred; fallback to remote)
+            backend = "latexmk" if shutil.which("latexmk") else "latexonline"
             try:
-                if shutil.which("latexmk"):
-                    pdf_bytes, page_count, _ = compile_with_latexmk(tex, jobname=f"{re.sub(r'[^A-Za-z0-9_-]+','_',username)}_resume")
+                if backend == "latexmk":
+                    jobname = f"{re.sub(r'[^A-Za-z0-9_-]+','_',username)}_resume"
+                    with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage="latexmk"):
+                        compiled = await compile_latex(tex, jobname=jobname, compiler="latexmk")
+                    pdf_bytes, page_count, latex_passes = compiled["pdf"], compiled["page_count"], compiled["passes"]
                     if page_count and page_count > 1:
-                        data = prune_for_single_page(data)
+                        # Estimator under-predicted; refit against a tighter budget, else fall back to fixed rules
+                        PDF_REFITS_TOTAL.inc(pipeline=pipeline)
+                        refit, refit_report = fit_resume_to_page(data, budget_scale=0.9)
+                        data = refit if refit_report["pruned"] else prune_for_single_page(data)
+                        layout["pruned"] += refit_report["pruned"]
                         tex = render_resume_tex_overleaf(data)
                         tex = re.sub(r"\\(newpage|clearpage)\\b", "", tex)
-                        pdf_bytes, page_count, _ = compile_with_latexmk(tex, jobname=f"{re.sub(r'[^A-Za-z0-9_-]+','_',username)}_resume")
+                        with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage="latexmk_refit"):
+                            compiled = await compile_latex(tex, jobname=jobname, compiler="latexmk")
+                        pdf_bytes, page_count = compiled["pdf"], compiled["page_count"]
+                        latex_passes += compiled["passes"]
+                    backend = pdf_backend_of(compiled)
                 else:
                     # Remote compile fallback
-                    pdf_bytes = compile_via_latexonline(tex)
+                    with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage="latexonline"):
+                        pdf_bytes = await run_sync_profiled(compile_via_latexonline, tex)
                     page_count = 0
-                pdf_b64 = "data:application/pdf;base64," + base64.b64encode(pdf_bytes).decode('ascii')
+                PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend=backend, outcome="success")
+            except CompileQueueFull:
+                # Shed load quickly instead of piling onto the slow remote fallback
+                PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend=backend, outcome="rejected")
+                raise
             except Exception as e:
+                PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend=backend, outcome="failure")
                 # Attempt remote fallback if local path failed, then simple PDF as last resort
                 try:
-                    pdf_bytes = compile_via_latexonline(tex)
+                    with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage="latexonline"):
+                        pdf_bytes = await run_sync_profiled(compile_via_latexonline, tex)
                     page_count = 0
-                    pdf_b64 = "data:application/pdf;base64," + base64.b64encode(pdf_bytes).decode('ascii')
+                    PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend="latexonline", outcome="success")
                 except Exception:
+                    PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend="latexonline", outcome="failure")
                     # Final fallback: render simple PDF so user still gets a valid file
                     try:
-                        pdf_bytes = render_simple_pdf_from_data(data)
+                        with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage="reportlab"):
+                            pdf_bytes = await run_sync_profiled(render_simple_pdf_from_data, data)
                         page_count = 1
-                        pdf_b64 = "data:application/pdf;base64," + base64.b64encode(pdf_bytes).decode('ascii')
+                        PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend="reportlab", outcome="success")
                     except Exception as e3:
+                        PDF_BACKEND_TOTAL.inc(pipeline=pipeline, backend="reportlab", outcome="failure")
                         raise HTTPException(status_code=500, detail=f"PDF compilation failed and fallback failed: {e3}")
+        PDF_PAGES_TOTAL.inc(pipeline=pipeline, pages=pdf_pages_label(page_count))
+        filename = f"{re.sub(r'[^A-Za-z0-9_-]+','_',username)}_resume.pdf"
+        pdf_b64 = "data:application/pdf;base64," + base64.b64encode(pdf_bytes).decode('ascii') if inline else None
+        pdf_artifact = artifact_store.put(pdf_bytes, "application/pdf", filename)
+        if tex != latex_stored:
+            # The page-count refit re-rendered the source
+            tex_artifact = artifact_store.put_text(tex, "application/x-tex", tex_filename)
+        yield "pdf", {
+            "filename": filename,
+            "pdf_artifact": pdf_artifact,
+            "tex_artifact": tex_artifact,
+            **({"pdf_base64": pdf_b64} if inline else {}),
+            "page_count": page_count,
+            "latex_passes": latex_passes,
+        }
 
         # ATS after
         plain_tailored = " ".join([
@@ -1046,29 +3539,74 @@ async def tailor_resume_overleaf(payload: Dict):
             " ".join(ed.get("degree","")+" "+ed.get("institute","") for ed in (data.get("education") or [])),
             join_inline(data.get("skills_left") or []), join_inline(data.get("skills_right") or [])
         ])
-        after_analysis = calculate_ats_score(plain_tailored, job_description)
+        with PIPELINE_STAGE_SECONDS.time(pipeline=pipeline, stage="ats_after"):
+            after_analysis = calculate_ats_score(plain_tailored, job_description)
         ats_after = after_analysis.get("score", 0)
         missing_after = after_analysis.get("missing_keywords", [])
+        yield "ats_after", {"ats_after": ats_after, "missing_keywords": missing_after}
         resp = {
             "status": "success",
-            "filename": f"{re.sub(r'[^A-Za-z0-9_-]+','_',username)}_resume.pdf",
-            "latex_source": tex,
-            "pdf_base64": pdf_b64,
+            "filename": filename,
+            "pdf_artifact": pdf_artifact,
+            "tex_artifact": tex_artifact,
             "ats_before": ats_before,
             "ats_after": ats_after,
             "missing_keywords": missing_after,
-            "page_count": page_count
+            "page_count": page_count,
+            "latex_passes": latex_passes,
+            "layout": layout,
+            "llm_cached": llm_cached,
         }
-        return resp
+        if inline:
+            resp.update({"latex_source": tex, "pdf_base64": pdf_b64})
+        yield "result", resp
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"tailor_resume_overleaf failed: {str(e)}")
 
+@app.post("/tailor_resume_overleaf")
+async def tailor_resume_overleaf(payload: Dict):
+    """Call Gemini to produce structured JSON per schema, render into Overleaf template, compile PDF, return base64+LaTeX+ATS.
+    Returns HTTP 500 on failure with a clear message.
+    """
+    resp = None
+    async for event, data in tailor_overleaf_events(payload):
+        if event == "result":
+            resp = data
+    return resp
+
+def sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/tailor_resume_overleaf/stream")
+async def tailor_resume_overleaf_stream(payload: Dict):
+    """Same pipeline as /tailor_resume_overleaf, streamed as server-sent events as each stage finishes.
+    A reportlab preview PDF is sent before the LaTeX compile unless "preview" is false. The final
+    "result" event carries the remaining fields (inline PDF/LaTeX are not repeated); failures after
+    the stream has started arrive as an "error" event.
+    """
+    events = tailor_overleaf_events(payload, preview=payload.get("preview", True) is not False)
+    # Pull the first stage eagerly so bad input still gets a proper HTTP status
+    first = await events.__anext__()
+
+    async def stream():
+        yield sse_event(*first)
+        try:
+            async for event, data in events:
+                if event == "result":
+                    data = {k: v for k, v in data.items() if k not in ("pdf_base64", "latex_source")}
+                yield sse_event(event, data)
+        except HTTPException as e:
+            yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/generate_cover_letter_overleaf")
 async def generate_cover_letter_overleaf(payload: Dict):
-    global gemini_api_key
-    resume_summary = payload.get("resume_summary", "")
+    resume_summary = await resolve_resume_text(payload, "resume_summary")
     job_description = payload.get("job_description", "")
     company = payload.get("company", "")
     role = payload.get("role", "")
@@ -1076,18 +3614,18 @@ async def generate_cover_letter_overleaf(payload: Dict):
     contact = payload.get("contact") or {}
 
     out = None
-    if gemini_api_key:
+    llm_cached = False
+    if current_api_key():
         try:
-            genai.configure(api_key=gemini_api_key)
-            model = genai.GenerativeModel('gemini-1.5-flash', generation_config={"temperature":0.4})
             prompt = (
                 "Generate a concise, single-page professional cover letter in 3–4 short paragraphs tailored to the JD and company. "
                 "Return JSON: { 'recipient': {'company':'...','role':'...'}, 'body':['para1','para2','para3','closing'], 'signoff':'Full Name' }. "
                 "Keep it ATS-friendly, factual, and action-oriented.\n\n"
                 f"Resume Summary:\n{resume_summary}\n\nJob Description:\n{job_description}\n\nCompany: {company}\nRole: {role}"
             )
-            resp = model.generate_content(prompt)
-            out = extract_json_object(getattr(resp, 'text', '') or '')
+            with PIPELINE_STAGE_SECONDS.time(pipeline="cover_letter_overleaf", stage="llm"):
+                out, llm_cached = await gemini_client.generate_cached(
+                    prompt, extract_json_object, temperature=0.4, bypass_cache=bool(payload.get("bypass_cache")))
         except Exception:
             out = None
     if not out:
@@ -1099,38 +3637,553 @@ async def generate_cover_letter_overleaf(payload: Dict):
         ], "signoff": name or "Candidate"}
 
     # Assemble LaTeX cover letter using existing cover_letter.tex template
-    base_dir = Path(__file__).parent
-    tpl_path = base_dir / "templates" / "cover_letter.tex"
-    if not tpl_path.exists():
+    tpl = get_template("cover_letter.tex")
+    if tpl is None:
         raise HTTPException(status_code=500, detail="cover_letter.tex not found")
-    tpl = tpl_path.read_text(encoding="utf-8")
 
     def esc(x):
         return escape_latex(x or "")
 
     body = out.get("body") or []
-    tex = tpl
-    tex = tex.replace("{{NAME}}", esc(name))
-    tex = tex.replace("{{EMAIL}}", esc(contact.get("email", "")))
-    tex = tex.replace("{{PHONE}}", esc(contact.get("phone", "")))
     links = ", ".join(filter(None, [contact.get("github"), contact.get("linkedin"), contact.get("website")]))
-    tex = tex.replace("{{LINKS}}", esc(links))
-    tex = tex.replace("{{COMPANY}}", esc(out.get("recipient", {}).get("company", company)))
-    tex = tex.replace("{{HIRING_MANAGER}}", esc("Hiring Manager"))
-    tex = tex.replace("{{JOB_TITLE}}", esc(out.get("recipient", {}).get("role", role)))
-    tex = tex.replace("{{OPENING}}", esc(body[0] if len(body)>0 else ""))
-    tex = tex.replace("{{SKILLS_FIT}}", esc(body[1] if len(body)>1 else ""))
-    tex = tex.replace("{{CONCLUSION}}", esc((body[2] if len(body)>2 else "") + (" " + body[3] if len(body)>3 else "")))
+    with PIPELINE_STAGE_SECONDS.time(pipeline="cover_letter_overleaf", stage="templating"):
+        tex = tpl.render({
+            "NAME": esc(name),
+            "EMAIL": esc(contact.get("email", "")),
+            "PHONE": esc(contact.get("phone", "")),
+            "LINKS": esc(links),
+            "COMPANY": esc(out.get("recipient", {}).get("company", company)),
+            "HIRING_MANAGER": esc("Hiring Manager"),
+            "JOB_TITLE": esc(out.get("recipient", {}).get("role", role)),
+            "OPENING": esc(body[0] if len(body)>0 else ""),
+            "SKILLS_FIT": esc(body[1] if len(body)>1 else ""),
+            "CONCLUSION": esc((body[2] if len(body)>2 else "") + (" " + body[3] if len(body)>3 else "")),
+        })
 
-    pdf_bytes = await compile_overleaf_pdf(tex, f"{re.sub(r'[^A-Za-z0-9_-]+','_',name or 'candidate')}_cover_letter.tex")
+    compiled = await compile_overleaf(tex, f"{re.sub(r'[^A-Za-z0-9_-]+','_',name or 'candidate')}_cover_letter.tex",
+                                      pipeline="cover_letter_overleaf")
+    PDF_PAGES_TOTAL.inc(pipeline="cover_letter_overleaf", pages=pdf_pages_label(compiled["page_count"]))
 
-    return {
+    filename = f"{re.sub(r'[^A-Za-z0-9_-]+','_',name or 'candidate')}_cover_letter.pdf"
+    resp = {
         "status": "success",
-        "filename": f"{re.sub(r'[^A-Za-z0-9_-]+','_',name or 'candidate')}_cover_letter.pdf",
-        "latex": tex,
-        "pdf_base64": base64.b64encode(pdf_bytes).decode('ascii')
+        "filename": filename,
+        **generated_artifacts(compiled["pdf"], filename, tex),
+        "latex_passes": compiled["passes"],
+        "llm_cached": llm_cached,
+    }
+    if payload.get("inline"):
+        resp.update({"latex": tex, "pdf_base64": base64.b64encode(compiled["pdf"]).decode('ascii')})
+    return resp
+
+@app.post("/application_bundle")
+async def application_bundle(payload: Dict):
+    """Tailored resume and cover letter from one request. Both branches (Gemini call and compile)
+    run concurrently, so latency is roughly the slower of the two rather than their sum.
+    Takes the union of the /tailor_resume_overleaf and /generate_cover_letter_overleaf inputs;
+    if only one branch fails its error is reported under "errors" and status is "partial".
+    """
+    resume_text = await resolve_resume_text(payload)
+    job_description = payload.get("job_description") or payload.get("jd_text", "")
+    if not resume_text.strip():
+        raise HTTPException(status_code=400, detail="resume_text is required")
+    if not (job_description or "").strip():
+        raise HTTPException(status_code=400, detail="job_description is required")
+    contact = payload.get("contact") or {}
+    resume_payload = {**payload, "resume_text": resume_text, "job_description": job_description}
+    cover_payload = {
+        **payload,
+        "resume_summary": payload.get("resume_summary") or resume_text,
+        "job_description": job_description,
+        "name": payload.get("name") or payload.get("username", ""),
+        "contact": contact,
+    }
+    results = await asyncio.gather(
+        tailor_resume_overleaf(resume_payload),
+        generate_cover_letter_overleaf(cover_payload),
+        return_exceptions=True,
+    )
+    for result in results:
+        # CancelledError and friends are not failures of one branch; let them propagate
+        if isinstance(result, BaseException) and not isinstance(result, Exception):
+            raise result
+    errors = {}
+    for part, result in zip(("resume", "cover_letter"), results):
+        if isinstance(result, HTTPException):
+            errors[part] = {"status_code": result.status_code, "detail": result.detail}
+        elif isinstance(result, BaseException):
+            errors[part] = {"status_code": 500, "detail": str(result)}
+    if len(errors) == len(results):
+        # Nothing to return; surface the resume failure as the request's error
+        first = results[0]
+        raise first if isinstance(first, HTTPException) else HTTPException(status_code=500, detail=f"application_bundle failed: {first}")
+    return {
+        "status": "partial" if errors else "success",
+        "resume": None if "resume" in errors else results[0],
+        "cover_letter": None if "cover_letter" in errors else results[1],
+        "errors": errors,
+    }
+
+# ---------- Background jobs ----------
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "600"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# A job whose worker stalled this many times is failed instead of being handed out again
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+_JOB_ABANDONED = {"status_code": 500, "detail": "Job abandoned: no worker finished it"}
+
+def _job_view(job: Dict) -> Dict:
+    """Public fields of a job record (never the payload or the session token)."""
+    view = {k: job.get(k) for k in ("id", "kind", "status", "created_at", "started_at", "finished_at")}
+    if job.get("status") == "succeeded":
+        view["result"] = job.get("result")
+    elif job.get("status") == "failed":
+        view["error"] = job.get("error")
+    return view
+
+class MemoryJobQueue:
+    """In-process job queue; jobs are lost on restart and only this process's workers see them."""
+    def __init__(self, ttl_seconds: int, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.ttl = ttl_seconds
+        self.max_attempts = max(1, max_attempts)
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, payload: Dict, session_token: Optional[str] = None) -> Dict:
+        job = {"id": secrets.token_urlsafe(12), "kind": kind, "payload": payload, "session_token": session_token,
+               "status": "queued", "attempts": 0, "created_at": time.time(), "started_at": None, "finished_at": None}
+        with self._lock:
+            self._purge_finished()
+            self._jobs[job["id"]] = job
+        return dict(job)
+
+    def claim(self, stale_after: float) -> Optional[Dict]:
+        """Mark the oldest queued job (or a running one whose worker stalled) as running and return it.
+        Stalled jobs that already used up max_attempts are failed instead.
+        """
+        now = time.time()
+        with self._lock:
+            for job in self._jobs.values():
+                stalled = job["status"] == "running" and job["started_at"] < now - stale_after
+                if stalled and job["attempts"] >= self.max_attempts:
+                    self._finish(job, None, _JOB_ABANDONED)
+                elif job["status"] == "queued" or stalled:
+                    job.update(status="running", started_at=now, attempts=job["attempts"] + 1)
+                    return dict(job)
+        return None
+
+    def finish(self, job_id: str, result: Optional[Dict] = None, error: Optional[Dict] = None) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._finish(job, result, error)
+
+    @staticmethod
+    def _finish(job: Dict, result: Optional[Dict], error: Optional[Dict]) -> None:
+        job.update(status="failed" if error else "succeeded", result=result, error=error,
+                   finished_at=time.time(), payload=None, session_token=None)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = Counter(job["status"] for job in self._jobs.values())
+        return {"backend": "memory", **{s: counts.get(s, 0) for s in ("queued", "running", "succeeded", "failed")}}
+
+    def _purge_finished(self) -> None:
+        cutoff = time.time() - self.ttl
+        for job_id in [k for k, j in self._jobs.items() if j["finished_at"] and j["finished_at"] < cutoff]:
+            del self._jobs[job_id]
+        # Jobs no worker got to within the TTL are failed, which also drops their session token
+        for job in self._jobs.values():
+            if not job["finished_at"] and job["created_at"] < cutoff:
+                self._finish(job, None, _JOB_ABANDONED)
+
+class SqliteJobQueue:
+    """Job queue in a SQLite file so API processes and separate worker processes
+    (`python main.py worker`) on the same host share it. Jobs carry the submitter's session token,
+    not their API key; the worker looks the key up in the session store when it runs the job,
+    and the token is cleared once the job finishes, fails or is abandoned.
+    """
+    def __init__(self, path: Path, ttl_seconds: int, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.ttl = ttl_seconds
+        self.max_attempts = max(1, max_attempts)
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._ready:
+            conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT, session_token TEXT,
+                                                 status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,
+                                                 result TEXT, error TEXT,
+                                                 created_at REAL NOT NULL, started_at REAL, finished_at REAL);
+                CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+            """)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "session_token" not in columns:
+                # Queues created before session tokens stored raw API keys: add the new columns and scrub the keys
+                conn.executescript("""
+                    ALTER TABLE jobs ADD COLUMN session_token TEXT;
+                    ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;
+                    UPDATE jobs SET api_key = NULL;
+                """)
+            self._ready = True
+        return conn
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        for field in ("payload", "result", "error"):
+            job[field] = json.loads(job[field]) if job[field] else None
+        return job
+
+    def submit(self, kind: str, payload: Dict, session_token: Optional[str] = None) -> Dict:
+        job_id = secrets.token_urlsafe(12)
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM jobs WHERE finished_at < ?", (now - self.ttl,))
+            # Jobs no worker got to within the TTL are failed, which also drops their session token
+            conn.execute("""UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, payload = NULL, session_token = NULL
+                            WHERE finished_at IS NULL AND created_at < ?""", (json.dumps(_JOB_ABANDONED), now, now - self.ttl))
+            conn.execute("INSERT INTO jobs (id, kind, payload, session_token, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                         (job_id, kind, json.dumps(payload), session_token, now))
+        finally:
+            conn.close()
+        return self.get(job_id)
+
+    def claim(self, stale_after: float) -> Optional[Dict]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock up front so two workers cannot claim the same row
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("""UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, payload = NULL, session_token = NULL
+                            WHERE status = 'running' AND started_at < ? AND attempts >= ?""",
+                         (json.dumps(_JOB_ABANDONED), now, now - stale_after, self.max_attempts))
+            row = conn.execute("""SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND started_at < ?)
+                                  ORDER BY created_at LIMIT 1""", (now - stale_after,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?", (now, row["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return {**self._row(row), "status": "running", "started_at": now, "attempts": row["attempts"] + 1}
+
+    def finish(self, job_id: str, result: Optional[Dict] = None, error: Optional[Dict] = None) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("""UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, payload = NULL, session_token = NULL
+                            WHERE id = ?""",
+                         ("failed" if error else "succeeded", json.dumps(result) if result is not None else None,
+                          json.dumps(error) if error else None, time.time(), job_id))
+        finally:
+            conn.close()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._row(row) if row else None
+
+    def stats(self) -> Dict:
+        conn = self._connect()
+        try:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        finally:
+            conn.close()
+        return {"backend": "sqlite", **{s: counts.get(s, 0) for s in ("queued", "running", "succeeded", "failed")}}
+
+def make_job_queue():
+    backend = os.getenv("JOB_QUEUE_BACKEND", STATE_BACKEND).lower()
+    if backend == "sqlite":
+        return SqliteJobQueue(Path(os.getenv("JOB_QUEUE_PATH") or (DATA_DIR / "jobs.sqlite3")), JOB_TTL_SECONDS)
+    if backend != "memory":
+        raise ValueError(f"Unknown JOB_QUEUE_BACKEND {backend!r} (use 'memory' or 'sqlite')")
+    return MemoryJobQueue(JOB_TTL_SECONDS)
+
+job_queue = make_job_queue()
+
+# Endpoint coroutines a job may run; each takes the same JSON payload as its HTTP route
+JOB_HANDLERS = {
+    "tailor_resume": tailor_resume_latex,
+    "tailor_resume_overleaf": tailor_resume_overleaf,
+    "cover_letter": generate_cover_letter,
+    "cover_letter_overleaf": generate_cover_letter_overleaf,
+    "application_bundle": application_bundle,
+}
+
+class JobWorkerPool:
+    """asyncio workers that drain job_queue. Queue methods run in threads so SQLite never blocks the loop."""
+    def __init__(self, queue, workers: int, timeout: float, poll_interval: float):
+        self.queue = queue
+        self.workers = max(0, workers)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self.processed = 0
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def run_forever(self) -> None:
+        self.workers = max(1, self.workers)
+        self.start()
+        await asyncio.gather(*self._tasks)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _worker(self) -> None:
+        while True:
+            job = await anyio.to_thread.run_sync(self.queue.claim, self.timeout * 2)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run_job(job)
+
+    async def run_job(self, job: Dict) -> None:
+        # The queue only holds the session token; the key stays in the session store
+        session = await anyio.to_thread.run_sync(session_store.get, job["session_token"]) if job.get("session_token") else None
+        token = _task_api_key.set(session.get("api_key") if session else None)
+        result, error = None, None
+        try:
+            result = await asyncio.wait_for(JOB_HANDLERS[job["kind"]](job["payload"] or {}), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            error = {"status_code": 504, "detail": f"Job timed out after {self.timeout:g}s"}
+        except HTTPException as e:
+            error = {"status_code": e.status_code, "detail": e.detail}
+        except Exception as e:
+            error = {"status_code": 500, "detail": f"{job['kind']} failed: {e}"}
+        finally:
+            _task_api_key.reset(token)
+        await anyio.to_thread.run_sync(self.queue.finish, job["id"], result, error)
+        self.processed += 1
+
+job_workers = JobWorkerPool(
+    job_queue,
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    timeout=JOB_TIMEOUT_SECONDS,
+    poll_interval=JOB_POLL_INTERVAL,
+)
+
+@app.on_event("startup")
+async def _start_job_workers():
+    job_workers.start()
+
+@app.on_event("shutdown")
+async def _stop_job_workers():
+    await job_workers.stop()
+
+@app.post("/jobs", status_code=202)
+async def submit_job(payload: Dict):
+    """Queue a long-running generation: {"kind": one of JOB_HANDLERS, "payload": {...same body as the endpoint}}.
+    Poll GET /jobs/{id}, or subscribe to GET /jobs/{id}/events, then read the result from the job.
+    """
+    kind = payload.get("kind")
+    if kind not in JOB_HANDLERS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of: {', '.join(JOB_HANDLERS)}")
+    body = payload.get("payload") or {}
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="payload must be an object")
+    job = await anyio.to_thread.run_sync(job_queue.submit, kind, body, _session_token.get())
+    job_workers.notify()
+    return {**_job_view(job), "status_url": f"/jobs/{job['id']}", "events_url": f"/jobs/{job['id']}/events"}
+
+@app.get("/jobs/stats")
+async def job_stats():
+    return {**await anyio.to_thread.run_sync(job_queue.stats), "workers": job_workers.workers, "processed": job_workers.processed}
+
+async def _get_job(job_id: str) -> Dict:
+    job = await anyio.to_thread.run_sync(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job_id")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status; includes "result" once succeeded or "error" once failed."""
+    return _job_view(await _get_job(job_id))
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent "status" events on every state change, ending with the finished job."""
+    job = await _get_job(job_id)
+
+    async def stream():
+        current, last_status = job, None
+        while True:
+            if current is None:
+                yield sse_event("error", {"status_code": 404, "detail": "Unknown or expired job_id"})
+                return
+            if current["status"] != last_status:
+                last_status = current["status"]
+                yield sse_event("status", _job_view(current))
+            if last_status in ("succeeded", "failed"):
+                return
+            await asyncio.sleep(min(JOB_POLL_INTERVAL, 0.5))
+            current = await anyio.to_thread.run_sync(job_queue.get, job_id)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def run_job_worker() -> None:
+    """Standalone worker process for the SQLite queue: `STATE_BACKEND=sqlite python main.py worker`.
+    Lets compile/generation workers scale separately from API processes (run those with JOB_WORKERS=0).
+    """
+    if not isinstance(job_queue, SqliteJobQueue):
+        raise SystemExit("A standalone worker needs a shared queue: set JOB_QUEUE_BACKEND=sqlite")
+    if STATE_BACKEND != "sqlite":
+        # Jobs name the submitter's session; its API key is only reachable through a shared session store
+        raise SystemExit("A standalone worker needs shared sessions: set STATE_BACKEND=sqlite")
+    await _load_templates()
+    metrics.start_flusher()
+    try:
+        await job_workers.run_forever()
+    finally:
+        metrics.stop_flusher()
+
+# ---------- Metrics endpoint ----------
+class MetricsMiddleware:
+    """Request count and latency per route template (never the raw path, so label cardinality stays bounded)."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route on the shared scope
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUESTS_TOTAL.inc(method=scope["method"], route=route, status=status)
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"], route=route)
+
+app.add_middleware(MetricsMiddleware)
+
+def _process_metrics():
+    """Counters these objects already keep for their /stats endpoints, per process."""
+    lookups = []
+    for name, cache in (("compile", compile_cache), ("extract", extract_cache), ("download", download_cache)):
+        lookups += [({"cache": name, "result": "memory_hit"}, cache.hits - cache.disk_hits),
+                    ({"cache": name, "result": "disk_hit"}, cache.disk_hits),
+                    ({"cache": name, "result": "miss"}, cache.misses)]
+    lookups += [({"cache": "llm", "result": "hit"}, llm_cache.hits), ({"cache": "llm", "result": "miss"}, llm_cache.misses)]
+    yield "hireme_cache_lookups_total", "counter", "Cache lookups by cache and result.", lookups
+    yield "hireme_latex_compiles_running", "gauge", "TeX processes currently running.", [({}, compile_scheduler.running)]
+    yield "hireme_latex_compiles_queued", "gauge", "TeX processes waiting for a scheduler slot.", [({}, compile_scheduler.waiting)]
+    yield "hireme_latex_compile_rejections_total", "counter", "Compiles refused because the queue was full, or killed at the timeout.", [
+        ({"reason": "queue_full"}, compile_scheduler.rejected), ({"reason": "timeout"}, compile_scheduler.timed_out)]
+    limiters = gemini_client.limiters()
+    yield "hireme_llm_requests_running", "gauge", "Gemini calls in flight.", [({}, sum(l.running for l in limiters))]
+    yield "hireme_llm_requests_waiting", "gauge", "Gemini calls waiting on the per-key limiter.", [({}, sum(l.waiting for l in limiters))]
+    yield "hireme_llm_retries_total", "counter", "Gemini calls retried after a quota error.", [({}, gemini_client.retries)]
+
+def _shared_metrics():
+    """State every worker sees (job database, artifact directory); reported once, not summed."""
+    jobs = job_queue.stats()
+    yield "hireme_jobs", "gauge", "Background jobs by status.", [
+        ({"status": s}, jobs.get(s, 0)) for s in ("queued", "running", "succeeded", "failed")]
+    artifacts = artifact_store.stats()
+    yield "hireme_artifacts", "gauge", "Generated files held in the artifact store.", [({}, artifacts["artifacts"])]
+    yield "hireme_artifact_bytes", "gauge", "Bytes held in the artifact store.", [({}, artifacts["bytes"])]
+
+metrics.add_collector(_process_metrics)
+metrics.add_collector(_shared_metrics, shared=True)
+
+@app.on_event("startup")
+async def _start_metrics_flusher():
+    metrics.start_flusher()
+
+@app.on_event("shutdown")
+async def _stop_metrics_flusher():
+    metrics.stop_flusher()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Pipeline stage latencies, PDF backend/fallback and page-count counters, cache, queue and HTTP
+    metrics in Prometheus text format, summed over all workers when METRICS_DIR is set.
+    """
+    families = await anyio.to_thread.run_sync(metrics.gather)
+    return Response(render_prometheus(families), media_type="text/plain; version=0.0.4")
+
+# ---------- Startup report ----------
+# "all" or comma-separated module names (e.g. "fitz,pdfplumber") to import before serving
+PREWARM_IMPORTS = os.getenv("PREWARM_IMPORTS", "")
+_MODULE_LOAD_SECONDS = round(time.perf_counter() - _BOOT_STARTED, 4)
+startup_report: Dict = {}
+
+def prewarm_imports(names: str) -> None:
+    wanted = None if names.strip().lower() == "all" else {n.strip() for n in names.split(",") if n.strip()}
+    for module in LAZY_MODULES:
+        if wanted is None or module._name in wanted:
+            module.load()
+
+@app.on_event("startup")
+async def _report_startup():
+    if PREWARM_IMPORTS:
+        started = time.perf_counter()
+        await anyio.to_thread.run_sync(prewarm_imports, PREWARM_IMPORTS)
+        startup_report["prewarm_seconds"] = round(time.perf_counter() - started, 4)
+    startup_report.update({
+        "eager_import_seconds": _EAGER_IMPORT_SECONDS,
+        "module_load_seconds": _MODULE_LOAD_SECONDS,
+        "ready_seconds": round(time.perf_counter() - _BOOT_STARTED, 4),
+    })
+    print("Startup:", json.dumps({**startup_report, "lazy_imports": import_timings}))
+
+@app.get("/startup/report")
+async def get_startup_report():
+    """Boot timings (seconds since main.py started importing) and per-module lazy import costs."""
+    return {
+        **startup_report,
+        "lazy_imports": import_timings,
+        "not_loaded": [m._name for m in LAZY_MODULES if m._name not in import_timings],
     }
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if sys.argv[1:2] == ["worker"]:
+        asyncio.run(run_job_worker())
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
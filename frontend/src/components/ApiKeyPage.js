@@ -23,6 +23,8 @@ const ApiKeyPage = ({ onApiKeySet }) => {
                 headers: { 'Content-Type': 'multipart/form-data' },
             });
             if (response.data.status === 'success') {
+                // The key stays server-side in our session; every later request identifies it by this token
+                axios.defaults.headers.common['X-Session-Token'] = response.data.session_token;
                 onApiKeySet(apiKey);
             } else {
                 setError('Failed to validate API key');
@@ -44,15 +44,22 @@ const ResultsPage = ({
       const data = response.data;
       console.log('tailor_resume_overleaf response', data);
       if (data.status === 'success') {
+        // PDF and LaTeX live in the backend artifact store; the PDF is loaded straight from its URL
+        const pdfUrl = data.pdf_artifact ? `${config.API_BASE_URL}${data.pdf_artifact.url}` : '';
+        let latexSource = '';
+        if (data.tex_artifact) {
+          const texResponse = await axios.get(`${config.API_BASE_URL}${data.tex_artifact.url}`, { responseType: 'text' });
+          latexSource = texResponse.data;
+        }
         const result = {
           new_ats_score: data.ats_after,
           improvement: data.ats_after - (analysisResults?.ats_score || 0),
-          tailored_resume: data.latex_source, // store LaTeX for modal only
-          pdf_base64: data.pdf_base64, // compiled PDF only (data URL)
+          tailored_resume: latexSource, // store LaTeX for modal only
+          pdf_url: pdfUrl, // compiled PDF served by /artifacts/{id}
           filename: data.filename || 'tailored_resume.pdf',
         };
         onTailoredComplete(result);
-        if (!data.pdf_base64 || !data.latex_source) {
+        if (!pdfUrl || !latexSource) {
           alert('Generation succeeded but missing PDF or LaTeX. Please retry.');
         }
         setExpandedSections(prev => ({ ...prev, tailored: true }));
@@ -64,35 +71,21 @@ const ResultsPage = ({
     }
   };
 
-  const b64ToBlob = (b64, contentType='application/pdf') => {
-    const byteCharacters = atob(b64);
-    const byteNumbers = new Array(byteCharacters.length);
-    for (let i = 0; i < byteCharacters.length; i++) {
-      byteNumbers[i] = byteCharacters.charCodeAt(i);
-    }
-    const byteArray = new Uint8Array(byteNumbers);
-    return new Blob([byteArray], { type: contentType });
-  };
-
   const handleDownload = async (format) => {
     if (!tailoredResults) return;
 
     try {
-      // Prefer direct PDF from base64 when available
-      if (format === 'pdf' && tailoredResults.pdf_base64) {
-        let url = tailoredResults.pdf_base64;
-        if (!url.startsWith('data:')) {
-          // raw base64 without data URL
-          const blob = b64ToBlob(tailoredResults.pdf_base64, 'application/pdf');
-          url = window.URL.createObjectURL(blob);
-        }
+      // Prefer the compiled PDF from the artifact store when available
+      if (format === 'pdf' && tailoredResults.pdf_url) {
+        const response = await axios.get(tailoredResults.pdf_url, { responseType: 'blob' });
+        const url = window.URL.createObjectURL(response.data);
         const link = document.createElement('a');
         link.href = url;
         link.setAttribute('download', tailoredResults.filename || 'tailored_resume.pdf');
         document.body.appendChild(link);
         link.click();
         link.remove();
-        if (!url.startsWith('data:')) window.URL.revokeObjectURL(url);
+        window.URL.revokeObjectURL(url);
         return;
       }
 
@@ -231,11 +224,11 @@ const ResultsPage = ({
             </div>
 
             {/* PDF Preview when available */}
-            {tailoredResults.pdf_base64 ? (
+            {tailoredResults.pdf_url ? (
               <div className="px-6 pt-6">
                 <div className="rounded-lg overflow-hidden border bg-white">
-                  <object data={tailoredResults.pdf_base64} type="application/pdf" width="100%" height="800">
-                    <iframe title="Optimized Resume PDF" src={tailoredResults.pdf_base64} className="w-full h-[70vh]" />
+                  <object data={tailoredResults.pdf_url} type="application/pdf" width="100%" height="800">
+                    <iframe title="Optimized Resume PDF" src={tailoredResults.pdf_url} className="w-full h-[70vh]" />
                   </object>
                 </div>
               </div>